@@ -0,0 +1,70 @@
+"""AT command round trip time against the emulated modem.
+
+Compares the byte by byte reader used before, with the buffered reader
+in Sim7020x._send_at_command. The emulator echoes the command, and
+answers after a fixed processing delay. AT+CMQPUB with a full 512 B
+message shows the cost of reading a long echo.
+
+Run with: python benchmarks/bench_at_roundtrip.py
+"""
+import time
+from aauiot import Sim7020Emulator
+from aauiot._sim7020e import Sim7020x, AtMsg
+
+N_COMMANDS = 200
+PROCESSING_DELAY = 0.002
+
+
+class LegacySim7020x(Sim7020x):
+    """Sim7020x with the previous byte by byte reader"""
+    def _send_at_command(self, at_cmd: str, timeout: float = 3):
+        self.ser.read_all()
+        self.ser.write(at_cmd.encode() + b'\r\n')
+        reply = b""
+        success = False
+        starttime = time.monotonic()
+        while time.monotonic() - starttime < timeout:
+            reply += self.ser.read(1)
+            if reply.endswith(b'OK\r\n'):
+                success = True
+                break
+            elif reply.endswith(b'ERROR\r\n'):
+                break
+        if success is False:
+            raise IOError(f"Error sending command: {at_cmd}")
+        return AtMsg(reply)
+
+
+def round_trip(cls, command) -> list[float]:
+    with Sim7020Emulator(PROCESSING_DELAY, attach_time=0) as modem:
+        sim = cls(modem.device)
+        sim.cmd_delay = 0
+        sim.enable_rf()
+        sim.mqtt_new("127.0.0.1", 1883)
+        sim.mqtt_connection("MQTT 3.1", "bench", 600)
+        times = []
+        for _ in range(N_COMMANDS):
+            start = time.perf_counter()
+            command(sim)
+            times.append(time.perf_counter() - start)
+        sim.ser.close()
+    return sorted(times)
+
+
+COMMANDS = {
+    "AT+CSQ": lambda sim: sim.signal_quality(),
+    "AT+CMQPUB": lambda sim: sim.mqtt_publish("aauiot/light", "x" * 512),
+}
+
+
+if __name__ == "__main__":
+    print(f"{N_COMMANDS} commands, {PROCESSING_DELAY * 1e3:.0f} ms "\
+          "modem processing delay")
+    print(f"{'command':>10} {'reader':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for cmd_name, command in COMMANDS.items():
+        for name, cls in (("legacy", LegacySim7020x), ("buffered", Sim7020x)):
+            times = round_trip(cls, command)
+            p50 = times[len(times) // 2]
+            p99 = times[int(len(times) * 0.99)]
+            print(f"{cmd_name:>10} {name:>10} "\
+                  f"{p50 * 1e3:>8.3f} {p99 * 1e3:>8.3f}")
@@ -0,0 +1,65 @@
+"""Cost per reply of parsing AT replies.
+
+Compares the previous AtMsg, which split the decoded reply several times
+and parsed the fields by index, with the single pass AtMsg and its typed
+fields. The replies are the ones Sim7020x reads most often, a publish
+of a full 512 B message and the MQTT connection query.
+
+Run with: python benchmarks/bench_atmsg_parse.py
+"""
+import timeit
+from aauiot._sim7020e import AtMsg
+
+N_CALLS = 100_000
+REPLIES = {
+    "AT+CMQPUB": b'AT+CMQPUB=0,"aauiot/light",0,0,0,512,"' + b"x" * 512
+                 + b'"\r\r\nOK\r\n',
+    "AT+CMQNEW?": b'AT+CMQNEW?\r\r\n+CMQNEW: 0,1,"130.225.37.241"'
+                  b'\r\n\r\nOK\r\n',
+}
+
+
+class LegacyAtMsg:
+    """AtMsg before the single pass parser"""
+    def __init__(self, msg: bytes | str):
+        if isinstance(msg, bytes):
+            msg = msg.decode()
+        self.echo = ""
+        self.success = ""
+        self.response = None
+        if '\r\r\n' in msg:
+            self.echo, msg = msg.split("\r\r\n")
+        if "\r\n\r\n" in msg:
+            tmp = msg.split("\r\n\r\n")
+            if len(tmp) > 1:
+                self.response = tmp[:-1]
+            msg = tmp[-1]
+        if "\r\n" in msg:
+            success = msg.split("\r\n")[0]
+            self.success = True if success == "OK" else False
+
+
+def legacy(reply: bytearray):
+    msg = LegacyAtMsg(bytes(reply[:len(reply)]))
+    if msg.response is not None:
+        connection = msg.response[0].split(",")
+        return int(connection[0][-1]), connection[2]
+    return msg.success
+
+
+def single_pass(reply: bytearray):
+    msg = AtMsg(reply, len(reply))
+    fields = msg.fields("+CMQNEW")
+    if fields is not None:
+        return fields[0], fields[2]
+    return msg.success
+
+
+if __name__ == "__main__":
+    for cmd, raw in REPLIES.items():
+        reply = bytearray(raw)
+        for name, func in (("legacy", legacy), ("single pass", single_pass)):
+            best = min(timeit.repeat(lambda: func(reply), number=N_CALLS,
+                                     repeat=5))
+            print(f"{cmd:>10} {name:>12}: "\
+                  f"{best / N_CALLS * 1e9:8.1f} ns/reply")
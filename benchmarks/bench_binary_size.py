@@ -0,0 +1,72 @@
+"""Size of the ASCII and binary wire formats, with a decoder round trip.
+
+Fills one 512 B modem buffer with samples in each format, and checks that
+the subscriber decoder returns the same values and timestamps as the
+ASCII payload.
+
+Run with: python benchmarks/bench_binary_size.py
+"""
+import os
+import random
+import sys
+from aauiot import MqttData
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "fullsetup", "subscriber"))
+from binary_format import decode_binary  # noqa: E402
+
+USERID = "comtek-6-xxx"
+BUFSIZE = 512
+N_SAMPLES = 1000
+
+
+def _timestamp(sec: int) -> str:
+    sec %= 86400
+    return f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}"
+
+
+def samples_per_publish(encode, single_ts: bool) -> int:
+    """Largest number of 1 Hz light samples which fit in BUFSIZE bytes"""
+    data = MqttData("light", timestamps=_timestamp(43200) if single_ts else None)
+    random.seed(0)
+    for idx in range(N_SAMPLES):
+        val = round(random.uniform(0, 2000), 1)
+        data.add_measurement(val, None if single_ts else _timestamp(43200 + idx))
+        if len(encode(data)) > BUFSIZE:
+            return idx
+    return N_SAMPLES
+
+
+def round_trip(data: MqttData, scale: int | None):
+    userid, ident, vals, timestamps = decode_binary(
+        data.serialize_binary(USERID, scale))
+    ascii_fields = data.serialize().split(",")
+    ts_idx = ascii_fields.index("ts")
+    assert userid == USERID
+    assert ident == ascii_fields[0]
+    assert timestamps == ascii_fields[ts_idx + 1:]
+    assert vals == ascii_fields[1:ts_idx], (vals, ascii_fields[1:ts_idx])
+
+
+if __name__ == "__main__":
+    random.seed(1)
+    for _ in range(100):
+        n_samples = random.randint(1, 50)
+        start = random.randint(0, 86399)
+        vals = [round(random.uniform(-50, 2000), 1) for _ in range(n_samples)]
+        timestamps = [_timestamp(start + 5 * idx) for idx in range(n_samples)]
+        round_trip(MqttData("light", vals, timestamps), 1)
+        round_trip(MqttData("light", vals, timestamps[0]), 1)
+        round_trip(MqttData("light", vals, timestamps), None)
+    print("Round trip OK\n")
+
+    encodings = {
+        "ascii": lambda data: USERID + "," + data.serialize(),
+        "float32": lambda data: data.serialize_binary(USERID),
+        "scaled 10^1": lambda data: data.serialize_binary(USERID, 1),
+    }
+    print(f"Samples per {BUFSIZE} B publish")
+    print(f"{'encoding':>12} {'per-sample ts':>14} {'single ts':>10}")
+    for name, encode in encodings.items():
+        print(f"{name:>12} {samples_per_publish(encode, False):>14} "\
+              f"{samples_per_publish(encode, True):>10}")
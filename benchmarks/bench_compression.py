@@ -0,0 +1,70 @@
+"""Compression ratio and CPU cost per message of the compressed payloads.
+
+Compresses representative send_topics payloads with raw deflate, and with
+the preset dictionary, checks the subscriber decompressor returns the
+original payload, and reports the sizes and microseconds per message to
+compress and decompress.
+
+Run with: python benchmarks/bench_compression.py
+"""
+import os
+import random
+import sys
+import timeit
+from aauiot import MqttData
+from aauiot._core import _compress
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "fullsetup", "subscriber"))
+from compression import decompress  # noqa: E402
+
+USERID = "comtek-6-xxx"
+N_CALLS = 2000
+
+
+def _timestamp(sec: int) -> str:
+    sec %= 86400
+    return f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}"
+
+
+def batch(identifier: str, n: int, low: float, high: float,
+          single_ts: bool = False) -> str:
+    """Payload of n 1 Hz samples, as send_topics publishes it"""
+    random.seed(0)
+    data = MqttData(identifier, bufsize=4096,
+                    timestamps=_timestamp(43200) if single_ts else None)
+    val = random.uniform(low, high)
+    for idx in range(n):
+        # A slow random walk, like a real sensor trace
+        val = min(max(val + random.gauss(0, (high - low) / 100), low), high)
+        data.add_measurement(round(val, 1),
+                             None if single_ts else _timestamp(43200 + idx))
+    return USERID + "," + data.serialize()
+
+
+BATCHES = {
+    "light 60 s": batch("light", 60, 0, 2000),
+    "temp 60 s": batch("temp", 60, 18, 26),
+    "light single ts": batch("light", 60, 0, 2000, single_ts=True),
+    "temp 5 samples": batch("temp", 5, 18, 26),
+}
+
+
+def main():
+    print(f"{'batch':<16} {'raw B':>6} {'method':<13} {'B':>5} {'ratio':>6} "
+          f"{'compress':>9} {'decompress':>11}")
+    for name, payload in BATCHES.items():
+        for method in ("deflate", "deflate-dict"):
+            compressed = _compress(payload, method)
+            assert decompress(compressed).decode() == payload
+            t_comp = timeit.timeit(lambda: _compress(payload, method),
+                                   number=N_CALLS) / N_CALLS
+            t_decomp = timeit.timeit(lambda: decompress(compressed),
+                                     number=N_CALLS) / N_CALLS
+            print(f"{name:<16} {len(payload):>6} {method:<13} "
+                  f"{len(compressed):>5} {len(payload) / len(compressed):>6.2f} "
+                  f"{t_comp * 1e6:>7.1f}us {t_decomp * 1e6:>9.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Import and construction time of aauiot.
+
+Hardware drivers, requests, paho, pyserial, asyncio and sqlite3 must not
+be imported by `import aauiot` or by constructing aau_iot, the script
+exits with an error if they are.
+
+Run with: python benchmarks/bench_import.py
+"""
+import subprocess
+import sys
+
+REPEATS = 10
+HEAVY_MODULES = ["board", "adafruit_bme680", "adafruit_veml7700",
+                 "adafruit_sgp30", "requests", "paho", "serial",
+                 "asyncio", "sqlite3"]
+
+_SCRIPT = f"""
+import sys, time
+start = time.perf_counter()
+import aauiot
+imported = time.perf_counter()
+iot = aauiot.aau_iot()
+constructed = time.perf_counter()
+heavy = [mod for mod in {HEAVY_MODULES!r} if mod in sys.modules]
+print(imported - start, constructed - imported, ",".join(heavy))
+"""
+
+
+def run_once() -> tuple[float, float, str]:
+    """Measure in a fresh interpreter, so nothing is cached"""
+    out = subprocess.run([sys.executable, "-c", _SCRIPT], check=True,
+                         capture_output=True, text=True).stdout.split(" ")
+    return float(out[0]), float(out[1]), out[2].strip()
+
+
+if __name__ == "__main__":
+    results = [run_once() for _ in range(REPEATS)]
+    import_time = min(res[0] for res in results)
+    construct_time = min(res[1] for res in results)
+    heavy = results[0][2]
+    print(f"import aauiot: {import_time * 1e3:8.2f} ms")
+    print(f"aau_iot():     {construct_time * 1e3:8.2f} ms")
+    if heavy:
+        sys.exit(f"Eagerly imported: {heavy}")
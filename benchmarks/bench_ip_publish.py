@@ -0,0 +1,41 @@
+"""Sustained publishes per second over IP, at QoS 0, 1 and 2.
+
+messaging_ip runs the paho network loop on a background thread, so the
+time is the publish calls plus flush, which waits for every message to be
+written, and acknowledged for QoS 1 and 2. Needs a MQTT broker, e.g. a
+local mosquitto.
+
+Run with: python benchmarks/bench_ip_publish.py [host] [port]
+"""
+import sys
+import time
+from aauiot._core import messaging_ip
+
+N_MESSAGES = 5000
+PAYLOAD = "group,light," + ",".join(["123.4"] * 80) + ",ts,12:00:00"
+
+
+def publish_rate(host: str, port: int, qos: int, max_inflight: int) -> float:
+    mqtt = messaging_ip(host, port, userid="bench", max_inflight=max_inflight)
+    while not mqtt.client.is_connected():
+        time.sleep(0.01)
+    start = time.perf_counter()
+    for _ in range(N_MESSAGES):
+        mqtt.publish("aauiot/bench", PAYLOAD, qos)
+    mqtt.flush()
+    elapsed = time.perf_counter() - start
+    mqtt.discon()
+    return N_MESSAGES / elapsed
+
+
+if __name__ == "__main__":
+    host = sys.argv[1] if len(sys.argv) > 1 else "localhost"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+    print(f"{N_MESSAGES} messages of {len(PAYLOAD)} B to {host}:{port}")
+    print(f"{'qos':>4} {'inflight':>9} {'msg/s':>9}")
+    for qos in (0, 1, 2):
+        for max_inflight in (1, 20, 100):
+            if qos == 0 and max_inflight != 20:
+                continue # Not acknowledged, so not limited by in flight
+            rate = publish_rate(host, port, qos, max_inflight)
+            print(f"{qos:>4} {max_inflight:>9} {rate:>9.0f}")
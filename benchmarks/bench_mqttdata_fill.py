@@ -0,0 +1,33 @@
+"""Fill cost per sample for MqttData at different buffer sizes.
+
+With O(1) size tracking the cost per sample should stay flat as the
+buffer grows, instead of growing with the buffer.
+
+Run with: python benchmarks/bench_mqttdata_fill.py
+"""
+import time
+from aauiot import MqttData
+
+BUFSIZES = [512, 4 * 1024, 64 * 1024]
+REPEATS = 20
+
+
+def fill(bufsize: int) -> int:
+    """Fill a MqttData object until the buffer is full, return samples."""
+    data = MqttData("light", timestamps="12:00:00", bufsize=bufsize)
+    n_samples = 0
+    while data.add_measurement(123.4) > 0:
+        n_samples += 1
+    data.serialize()
+    return n_samples
+
+
+if __name__ == "__main__":
+    print(f"{'bufsize':>8} {'samples':>8} {'us/sample':>10}")
+    for bufsize in BUFSIZES:
+        best = float("inf")
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            n_samples = fill(bufsize)
+            best = min(best, time.perf_counter() - start)
+        print(f"{bufsize:>8} {n_samples:>8} {best / n_samples * 1e6:>10.3f}")
@@ -0,0 +1,37 @@
+"""Memory use of MqttData vs CompactMqttData for long buffering windows.
+
+Fills both classes with 1 Hz samples, each with its own timestamp, and
+reports the traced allocation per sample.
+
+Run with: python benchmarks/bench_mqttdata_memory.py
+"""
+import tracemalloc
+from aauiot import MqttData, CompactMqttData
+
+SAMPLE_COUNTS = [10_000, 1_000_000]
+
+
+def _timestamp(sec: int) -> str:
+    sec %= 86400
+    return f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}"
+
+
+def measure(cls, n_samples: int) -> int:
+    """Return the number of bytes allocated for n_samples samples"""
+    tracemalloc.start()
+    data = cls("light", bufsize=2**31)
+    for idx in range(n_samples):
+        data.add_measurement(float(idx) * 0.1, _timestamp(idx))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size
+
+
+if __name__ == "__main__":
+    print(f"{'class':>16} {'samples':>9} {'MiB':>8} {'B/sample':>9}")
+    for n_samples in SAMPLE_COUNTS:
+        for cls in (MqttData, CompactMqttData):
+            size = measure(cls, n_samples)
+            print(f"{cls.__name__:>16} {n_samples:>9} "\
+                  f"{size / 2**20:>8.2f} {size / n_samples:>9.1f}")
@@ -0,0 +1,27 @@
+"""Cost per call of the sensor timestamp.
+
+Compares formatting a timezone aware datetime on every call, with the
+cached TimestampProvider in both formats.
+
+Run with: python benchmarks/bench_timestamp.py
+"""
+import timeit
+from datetime import datetime, timezone
+from aauiot import TimestampProvider
+
+N_CALLS = 200_000
+
+
+def strftime_every_call():
+    return datetime.now(tz=timezone.utc).strftime("%H:%M:%S")
+
+
+if __name__ == "__main__":
+    candidates = {
+        "strftime per call": strftime_every_call,
+        "provider hms": TimestampProvider(),
+        "provider epoch_ms": TimestampProvider("epoch_ms"),
+    }
+    for name, func in candidates.items():
+        best = min(timeit.repeat(func, number=N_CALLS, repeat=5))
+        print(f"{name:>18}: {best / N_CALLS * 1e9:8.1f} ns/call")
@@ -0,0 +1,17 @@
+"""End to end throughput and latency of the aauiot transports.
+
+Each run fills MqttData batches at a sample rate, sends them with
+send_topics, and receives them from the broker with a subscriber which
+decodes the payloads like fullsetup/subscriber/subscriber.py, up to the
+database insert. messaging_ip publishes to the broker directly,
+messaging_nbiot through Sim7020Emulator, which forwards to the same broker.
+
+The sweep covers batch size, QoS and sample rate, and reports messages/s,
+samples/s and the p50/p99 latency from send_topics to the decoded message.
+Results are written as JSON, to compare between releases.
+
+Needs a MQTT broker, e.g. a local mosquitto. Run from the repository root:
+
+    python -m benchmarks.transport --out results.json
+    python -m benchmarks.transport --baseline old.json --out new.json
+"""
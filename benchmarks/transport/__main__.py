@@ -0,0 +1,103 @@
+"""Command line of the transport benchmark, see benchmarks.transport."""
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import sys
+from importlib import metadata
+from .runner import RunConfig, run
+
+
+def _version() -> str:
+    try:
+        return metadata.version("aau-iot-testbed")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _key(result: dict) -> tuple:
+    return (result["transport"], result["batch"], result["qos"],
+            result["rate"])
+
+
+def _compare(results: list[dict], path: str):
+    """Print the change against the results of a previous run"""
+    with open(path) as f:
+        baseline = {_key(result): result for result in json.load(f)["results"]}
+    print(f"\nChange against {path}")
+    print(f"{'transport':<9} {'batch':>5} {'qos':>3} {'rate':>6} "
+          f"{'msg/s':>8} {'p99':>8}")
+    for result in results:
+        old = baseline.get(_key(result))
+        if old is None or not old["msg_per_s"]:
+            continue
+        rate = result["msg_per_s"] / old["msg_per_s"] - 1
+        p99 = result["latency_ms"]["p99"] / old["latency_ms"]["p99"] - 1
+        print(f"{result['transport']:<9} {result['batch']:>5} "
+              f"{result['qos']:>3} {result['rate']:>6g} "
+              f"{rate:>+8.1%} {p99:>+8.1%}")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.transport",
+        description="Throughput and latency of messaging_ip and "
+                    "messaging_nbiot, from send_topics to the subscriber.")
+    parser.add_argument("--broker", default="localhost:1883",
+                        help="MQTT broker as host:port")
+    parser.add_argument("--transport", nargs="+", default=["ip", "nbiot"],
+                        choices=["ip", "nbiot"])
+    parser.add_argument("--batch", nargs="+", type=int, default=[1, 10, 50],
+                        help="Samples per message")
+    parser.add_argument("--qos", nargs="+", type=int, default=[0, 1, 2],
+                        choices=[0, 1, 2])
+    parser.add_argument("--rate", nargs="+", type=float, default=[0, 100],
+                        help="Samples per second, 0 for as fast as possible")
+    parser.add_argument("--messages", type=int, default=500,
+                        help="Messages per IP run")
+    parser.add_argument("--nbiot-messages", type=int, default=100,
+                        help="Messages per NB-IoT run")
+    parser.add_argument("--out", default="transport_results.json")
+    parser.add_argument("--baseline",
+                        help="Results of a previous run, to compare with")
+    args = parser.parse_args(argv)
+    host, _, port = args.broker.partition(":")
+    port = int(port or 1883)
+
+    results = []
+    print(f"{'transport':<9} {'batch':>5} {'qos':>3} {'rate':>6} "
+          f"{'msg/s':>8} {'samples/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'lost':>4}")
+    for transport, batch, qos, rate in itertools.product(
+            args.transport, args.batch, args.qos, args.rate):
+        messages = args.messages if transport == "ip" else args.nbiot_messages
+        if rate:
+            # Keep throttled runs short, at most 10 s
+            messages = min(messages, max(int(10 * rate / batch), 1))
+        result = run(RunConfig(transport, batch, qos, rate, messages),
+                     host, port)
+        results.append(result)
+        print(f"{transport:<9} {batch:>5} {qos:>3} {rate:>6g} "
+              f"{result['msg_per_s']:>8.0f} {result['samples_per_s']:>10.0f} "
+              f"{result['latency_ms']['p50']:>8.2f} "
+              f"{result['latency_ms']['p99']:>8.2f} {result['lost']:>4}")
+
+    report = {
+        "package": "aau-iot-testbed",
+        "version": _version(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "broker": f"{host}:{port}",
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.out}")
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
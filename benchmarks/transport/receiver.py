@@ -0,0 +1,88 @@
+"""Subscriber side of a run, timing the arrival of each message."""
+import os
+import sys
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..",
+                                "fullsetup", "subscriber"))
+from binary_format import decode_binary  # noqa: E402
+from compression import decompress, Z_TOPIC  # noqa: E402
+
+IDENTIFIER = "light"
+"""Identifier of the messages, followed by the sequence number"""
+
+
+def decode(topic: str, payload: bytes,
+           prefix: str) -> tuple[str, str, list[str]]:
+    """Decode a message like subscriber.on_message, returns the userid,
+    identifier and values"""
+    if topic.startswith(prefix + Z_TOPIC):
+        payload = decompress(payload)
+        topic = prefix + topic[len(prefix + Z_TOPIC):]
+    if topic.startswith(prefix + "bin/"):
+        return decode_binary(payload)[:3]
+    fields = payload.decode("UTF-8").split(",")
+    return fields[0], fields[1], fields[2:fields.index("ts")]
+
+
+class Receiver:
+    """Subscribes to the topics of a run
+
+    The identifier of every message ends with its sequence number, e.g.
+    "light42", as the values are rounded to 4 significant digits.
+    """
+    def __init__(self, host: str, port: int, prefix: str):
+        self._prefix = prefix
+        self.received: dict[int, float] = {}
+        """Arrival time by sequence number"""
+        self.samples = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._subscribed = threading.Event()
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_message = self._on_message
+        self.client.connect(host, port)
+        self.client.loop_start()
+        if not self._subscribed.wait(10):
+            raise IOError(f"Could not subscribe at {host}:{port}")
+
+    def _on_connect(self, client, userdata, flags, rc):
+        client.subscribe(self._prefix + "#", qos=2)
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        self._subscribed.set()
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            _, identifier, vals = decode(msg.topic, msg.payload,
+                                         self._prefix)
+            seq = int(identifier[len(IDENTIFIER):])
+        except (ValueError, IndexError):
+            self.errors += 1
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self.received[seq] = now
+            self.samples += len(vals)
+
+    def wait(self, count: int, timeout: float) -> bool:
+        """Wait until count messages are received, or for timeout seconds
+        without a new message"""
+        deadline = time.monotonic() + timeout
+        received = len(self.received)
+        while received < count:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+            if len(self.received) > received:
+                received = len(self.received)
+                deadline = time.monotonic() + timeout
+        return True
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
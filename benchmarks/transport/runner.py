@@ -0,0 +1,120 @@
+"""A single run of the sweep, for one transport and configuration."""
+from __future__ import annotations
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from aauiot import MqttData, Sim7020Emulator
+from aauiot._core import messaging_ip, messaging_nbiot
+from .receiver import IDENTIFIER, Receiver
+
+USERID = "comtek-6-bench"
+
+
+@dataclass
+class RunConfig:
+    transport: str
+    """"ip" or "nbiot" """
+    batch: int
+    """Samples per message"""
+    qos: int
+    rate: float
+    """Samples per second, 0 for as fast as possible"""
+    messages: int
+
+
+def _quantile(values: list[float], q: float) -> float:
+    """Nearest rank quantile of sorted values"""
+    if not values:
+        return math.nan
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def _timestamp(sec: float) -> str:
+    sec = int(sec) % 86400
+    return f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}"
+
+
+def _connect(config: RunConfig, host: str, port: int, prefix: str,
+             modem: Sim7020Emulator | None):
+    if config.transport == "ip":
+        mqtt = messaging_ip(host, port, prefix, USERID)
+        while not mqtt.client.is_connected():
+            time.sleep(0.01)
+        return mqtt
+    return messaging_nbiot(host, port, prefix, USERID, device=modem.device)
+
+
+def _flush(mqtt):
+    if isinstance(mqtt, messaging_ip):
+        mqtt.flush(30)
+
+
+def run(config: RunConfig, host: str, port: int,
+        drain_timeout: float = 10) -> dict:
+    """Send config.messages messages and time their arrival
+
+    Messages not received after drain_timeout seconds without a new one
+    are counted as lost.
+
+    Returns
+    -----
+    dict : The configuration, next to the messages and samples received,
+        lost messages, msg_per_s, samples_per_s and latency_ms p50, p99
+        and max.
+    """
+    prefix = f"aaubench/{uuid.uuid4().hex[:8]}/"
+    receiver = Receiver(host, port, prefix)
+    modem = None
+    if config.transport == "nbiot":
+        modem = Sim7020Emulator(attach_time=0.1, broker=(host, port))
+        modem.start()
+    mqtt = _connect(config, host, port, prefix, modem)
+    rng = random.Random(0)
+    sent_at: dict[int, float] = {}
+    interval = config.batch / config.rate if config.rate else 0.0
+    start = time.perf_counter()
+    try:
+        for seq in range(config.messages):
+            if interval:
+                # Send when the batch of samples is complete
+                delay = start + (seq + 1) * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            data = MqttData(f"{IDENTIFIER}{seq}",
+                            timestamps=_timestamp(time.time()),
+                            bufsize=mqtt.max_payload)
+            for _ in range(config.batch):
+                data.add_measurement(round(rng.uniform(0, 2000), 1))
+            sent_at[seq] = time.perf_counter()
+            mqtt.send_topics(data, config.qos)
+        _flush(mqtt)
+        receiver.wait(config.messages, drain_timeout)
+        elapsed = max(receiver.received.values(), default=start) - start
+    finally:
+        mqtt.discon()
+        receiver.close()
+        if modem is not None:
+            modem.stop()
+
+    latencies = sorted(t - sent_at[seq]
+                       for seq, t in receiver.received.items()
+                       if seq in sent_at)
+    received = len(latencies)
+    result = asdict(config)
+    result.update({
+        "received": received,
+        "lost": config.messages - received,
+        "samples": receiver.samples,
+        "decode_errors": receiver.errors,
+        "duration_s": elapsed,
+        "msg_per_s": received / elapsed if elapsed > 0 else 0.0,
+        "samples_per_s": receiver.samples / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": _quantile(latencies, 0.5) * 1e3,
+            "p99": _quantile(latencies, 0.99) * 1e3,
+            "max": latencies[-1] * 1e3 if latencies else math.nan,
+        },
+    })
+    return result
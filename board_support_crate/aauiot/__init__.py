@@ -1 +1,6 @@
-from ._core import aau_iot, MqttData
\ No newline at end of file
+from ._core import aau_iot, MqttData, CompactMqttData, MqttMultiData, \
+    MqttBatcher, MemoryOutbox, SensorSampler, TimestampProvider, \
+    set_timestamp_provider, messaging_ip_async, messaging_nbiot_async
+from ._simulated import SimulatedBackend, ReplayBackend
+from ._outbox import Outbox
+from ._emulator import Sim7020Emulator
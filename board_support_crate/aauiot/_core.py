@@ -1,18 +1,47 @@
 
 #%%
+from __future__ import annotations
 import time
+import math
+import queue
+import heapq
+import struct
+import threading
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import Future
 from enum import Enum
-from typing import Literal
-from datetime import datetime
-import requests
-from pytz import UTC
-import board
-from adafruit_bme680 import Adafruit_BME680_I2C as BME680
-from adafruit_veml7700 import VEML7700
-from adafruit_sgp30 import Adafruit_SGP30 as SGP30
-import paho.mqtt.client as mqtt
-from aauiot._sim7020e import Sim7020x
-i2c = board.I2C()
+from typing import TYPE_CHECKING, Callable, Literal
+from datetime import datetime, timezone
+# Hardware drivers, requests, paho and pyserial are imported on first use,
+# so the package imports quickly and without a Pi.
+if TYPE_CHECKING:
+    from adafruit_bme680 import Adafruit_BME680_I2C as BME680
+    from adafruit_veml7700 import VEML7700
+    from adafruit_sgp30 import Adafruit_SGP30 as SGP30
+
+
+class _lazy:
+    """Create an object on the first call, and return it afterwards"""
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._factory()
+        return self._obj
+
+def _create_i2c():
+    import board
+    return board.I2C()
+
+_i2c = _lazy(_create_i2c)
+
 _bme_oversample_t = Literal["ovr_samp_0","ovr_samp_1","ovr_samp_2",
                           "ovr_samp_4","ovr_samp_8","ovr_samp_16"]
 
@@ -24,11 +53,50 @@ class _bme_oversample(Enum):
     ovr_samp_8  = 8
     ovr_samp_16 = 16
 
+class TimestampProvider:
+    """Timestamps for sensor readings in UTC.
+
+    The "HH:MM:SS" string is cached, and only formatted again when the
+    second changes. With fmt="epoch_ms" integer epoch milliseconds are
+    returned instead, note MqttData only accepts "HH:MM:SS" timestamps.
+    """
+    _ts_format = Literal["hms", "epoch_ms"]
+    def __init__(self, fmt: _ts_format = "hms"):
+        if fmt not in TimestampProvider._ts_format.__args__:
+            raise ValueError(f"Invalid format: must be in: "\
+                             f"{TimestampProvider._ts_format.__args__}")
+        self.fmt = fmt
+        # (second, formatted), replaced as one so threads see a valid pair
+        self._cache = (None, "")
+
+    def __call__(self) -> str | int:
+        """Return current timestamp"""
+        if self.fmt == "epoch_ms":
+            return time.time_ns() // 1_000_000
+        sec = int(time.time())
+        cached_sec, cached_ts = self._cache
+        if sec != cached_sec:
+            cached_ts = datetime.fromtimestamp(sec, timezone.utc)\
+                .strftime("%H:%M:%S")
+            self._cache = (sec, cached_ts)
+        return cached_ts
+
+_timestamp_provider = TimestampProvider()
+
+def set_timestamp_provider(provider: Callable[[], str | int]):
+    """Set the timestamp source for sensor readings and aau_iot.get_time
+
+    Parameters
+    -----
+    provider : Callable[[], str | int]
+        Called for every reading, e.g. TimestampProvider("epoch_ms").
+    """
+    global _timestamp_provider
+    _timestamp_provider = provider
+
 def _get_time():
     """Get current time in UTC"""
-    frmt_str = "%H:%M:%S"
-    ts = datetime.now(tz=UTC)
-    return ts.strftime(frmt_str)
+    return _timestamp_provider()
 
 def _time_decorater(func):
     """Decorator to append timestamp to output"""
@@ -38,10 +106,16 @@ def _time_decorater(func):
         return results, ts
     return _decorator
 
-class _humidity:
-    def __init__(self, sensor: BME680):
-        self.sensor = sensor
+class _sensor:
+    """Base for sensor wrappers, the driver is created on first access"""
+    def __init__(self, sensor: Callable):
+        self._get_sensor = sensor
+
+    @property
+    def sensor(self):
+        return self._get_sensor()
 
+class _humidity(_sensor):
     @_time_decorater
     def __call__(self):
         """Return Humidity in [%]"""
@@ -53,10 +127,7 @@ class _humidity:
             rate = _bme_oversample[rate]
         self.sensor.humidity_oversample = rate.value
 
-class _temperature:
-    def __init__(self, sensor: BME680):
-        self.sensor = sensor
-
+class _temperature(_sensor):
     @_time_decorater
     def __call__(self):
         """Return temperature in [degC]"""
@@ -68,10 +139,7 @@ class _temperature:
             rate = _bme_oversample[rate]
         self.sensor.temperature_oversample = rate.value
 
-class _pressure:
-    def __init__(self, sensor: BME680):
-        self.sensor = sensor
-
+class _pressure(_sensor):
     @_time_decorater
     def __call__(self):
         """Return pressure in [hPa]"""
@@ -83,24 +151,44 @@ class _pressure:
             rate = _bme_oversample[rate]
         self.sensor.pressure_oversample = rate.value
 
-class _light:
+class _environment(_sensor):
+    """Temperature, humidity and pressure from a single BME680 measurement"""
+    @_time_decorater
+    def __call__(self):
+        """Return temperature, humidity and pressure from one measurement
+        using the oversample rates of each channel.
+
+        Returns
+        ----
+        list : [temperature [degC], humidity [%], pressure [hPa]]
+        """
+        sensor = self.sensor
+        refresh_time = sensor._min_refresh_time
+        try:
+            # Force one reading, and let the properties reuse it.
+            sensor._min_refresh_time = 0
+            sensor._perform_reading()
+            sensor._min_refresh_time = math.inf
+            return [sensor.temperature, sensor.humidity, sensor.pressure]
+        finally:
+            sensor._min_refresh_time = refresh_time
+
+class _light(_sensor):
     """Class for controlling Light parameters of the VEML7700 sensor"""
+    # Register values, as defined by adafruit_veml7700.VEML7700
     class int_time_val(Enum):
-        ALS_25MS = VEML7700.ALS_25MS
-        ALS_50MS = VEML7700.ALS_50MS
-        ALS_100MS = VEML7700.ALS_100MS
-        ALS_200MS = VEML7700.ALS_200MS
-        ALS_400MS = VEML7700.ALS_400MS
-        ALS_800MS = VEML7700.ALS_800MS
+        ALS_25MS = 0x0C
+        ALS_50MS = 0x08
+        ALS_100MS = 0x00
+        ALS_200MS = 0x01
+        ALS_400MS = 0x02
+        ALS_800MS = 0x03
 
     class gain_val(Enum):
-        ALS_GAIN_1 = VEML7700.ALS_GAIN_1
-        ALS_GAIN_2 = VEML7700.ALS_GAIN_2
-        ALS_GAIN_1_8 = VEML7700.ALS_GAIN_1_8
-        ALS_GAIN_1_4 = VEML7700.ALS_GAIN_1_4
-
-    def __init__(self, sensor: VEML7700):
-        self.sensor = sensor
+        ALS_GAIN_1 = 0x0
+        ALS_GAIN_2 = 0x1
+        ALS_GAIN_1_8 = 0x2
+        ALS_GAIN_1_4 = 0x3
 
     @_time_decorater
     def __call__(self):
@@ -133,10 +221,7 @@ class _light:
             raise ValueError("Invalid value must be in gain_val")
         self.sensor.light_gain = gain.value
 
-class _gas:
-    def __init__(self, sensor: SGP30):
-        self.sensor = sensor
-
+class _gas(_sensor):
     @_time_decorater
     def __call__(self):
         """Return TVOC and eCO2 in [ppb] and [ppm]
@@ -156,15 +241,117 @@ class _gas:
         """
         return [self.sensor.baseline_TVOC, self.sensor.baseline_eCO2]
 
+# Identifiers of the values of sensors returning several, see SensorSampler.
+_SENSOR_CHANNELS = {
+    "environment": ("temperature", "humidity", "pressure"),
+    "gas": ("tvoc", "eco2"),
+}
+
+# Binary wire format, see serialize_binary.
+_BIN_MAGIC = 0xA5
+_BIN_VERSION = 1
+_BIN_FLAG_SCALED = 0x01
+_BIN_TOPIC = "bin/"
+
+def _put_varint(out: bytearray, value: int):
+    """Append unsigned LEB128 varint"""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _ts_to_sec(ts: str) -> int:
+    """Convert "HH:MM:SS" to seconds of the day"""
+    try:
+        hours, mins, secs = ts.split(":")
+        return int(hours) * 3600 + int(mins) * 60 + int(secs)
+    except ValueError as err:
+        raise ValueError(f"Timestamp {ts} is not formatted as "\
+                         "\"HH:MM:SS\"") from err
+
+def _encode_binary(userid: str,
+                   identifier: str,
+                   vals,
+                   timestamps: list[str],
+                   scale: int | None = None) -> bytes:
+    """Encode samples in the binary wire format
+
+    Layout
+    -----
+    magic (u8), version (u8), flags (u8), scale (i8),
+    len(userid) (u8), userid, len(identifier) (u8), identifier,
+    n_vals (varint), n_ts (varint),
+    first timestamp in seconds of the day (varint),
+    n_ts-1 timestamp deltas modulo 24 h (varint),
+    values as big endian float32, or zigzag varint of val * 10**scale.
+    """
+    uid = userid.encode()
+    ident = identifier.encode()
+    flags = 0 if scale is None else _BIN_FLAG_SCALED
+    out = bytearray(struct.pack(">BBBbB", _BIN_MAGIC, _BIN_VERSION, flags,
+                                scale or 0, len(uid)))
+    out += uid
+    out.append(len(ident))
+    out += ident
+    _put_varint(out, len(vals))
+    _put_varint(out, len(timestamps))
+    prev = None
+    for ts in timestamps:
+        sec = _ts_to_sec(ts)
+        _put_varint(out, sec if prev is None else (sec - prev) % 86400)
+        prev = sec
+    if scale is None:
+        out += struct.pack(f">{len(vals)}f", *vals)
+    else:
+        factor = 10 ** scale
+        for val in vals:
+            scaled = round(val * factor)
+            _put_varint(out, (scaled << 1) ^ (scaled >> 63))
+    return bytes(out)
+
+# Compressed payloads are published under "<topic>z/", and start with the
+# codec byte. The dictionary must match the subscriber, see
+# fullsetup/subscriber/compression.py.
+_Z_TOPIC = "z/"
+_Z_DEFLATE = 0x01
+_Z_DEFLATE_DICT = 0x02
+_ZDICT = ("comtek-6-group,gas,pressure,humidity,environment,multiple,light,"
+          "temp,ts,00:00:00,12:00:00,12:00:01,12:00:02,12:00:03,12:00:04,"
+          ",0.1,1.2,12.3,21.5,123.4,1013,1234").encode()
+_compressions = Literal["deflate", "deflate-dict"]
+
+def _compress(payload: str | bytes, method: _compressions) -> bytes:
+    """Compress a payload with raw deflate, optionally with the preset
+    dictionary, which helps on short messages."""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if method == "deflate":
+        codec = _Z_DEFLATE
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    elif method == "deflate-dict":
+        codec = _Z_DEFLATE_DICT
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=_ZDICT)
+    else:
+        raise ValueError(f"Invalid compression: must be in: "\
+                         f"{_compressions.__args__}")
+    return bytes((codec,)) + compressor.compress(payload) + compressor.flush()
+
+
 class MqttData:
-    """Data class for parsing Sensor data, to MQTT broker."""
+    """Data class for parsing Sensor data, to MQTT broker.
+
+    The serialized size is tracked incrementally, so ``len(obj)`` and the
+    buffer remainder returned by ``add_measurement`` are O(1). The
+    serialized string is cached until the object is modified.
+    """
     def __init__(self,
                  identifier: str,
                  values: list | None = None,
-                 timestamps: str | list[str] | None = None
+                 timestamps: str | list[str] | None = None,
+                 bufsize: int = 512
                  ):
         self._ident = identifier
-        self._bufsize = 512
+        self._bufsize = bufsize
         if values is None:
             self.vals = []
         elif isinstance(values, list):
@@ -183,13 +370,26 @@ class MqttData:
                     f"\nMust be 0,1 or Same as values.")
             self.ts = timestamps
 
+        # Serialized value fields, kept parallel to self.vals
+        self._val_strs = [f",{val:.4g}" for val in self.vals]
+        # identifier + ",ts" + values + ",HH:MM:SS" per timestamp
+        self._size = len(self._ident) + 3
+        self._size += sum(len(val) for val in self._val_strs)
+        self._size += sum(len(ts) + 1 for ts in self.ts)
+        self._cache = None
+
     def __len__(self):
-        return len(self.serialize())
+        return self._size
 
     @property
     def identifier(self):
         return self._ident
 
+    @property
+    def bufsize(self):
+        """Size of the transport buffer the object is measured against."""
+        return self._bufsize
+
     def add_measurement(self,
                         val: object,
                         ts: None | str = None) -> int:
@@ -198,7 +398,7 @@ class MqttData:
         Params
         -----
         val : object
-            Data which can be represented as a string
+            Sample, formatted with 4 significant digits.
         ts : None | str
             Timestamp associated with datapoint, if None is giving,
             all points will use the first timestamp.
@@ -218,7 +418,14 @@ class MqttData:
           If there are less timestamps than samples but more than one.
         ValueError
           If the Timestamps are not string formatted.
+        ValueError
+          If val is not a number, the object is left unchanged.
         """
+        # Formatted first, so a failure leaves the object unchanged
+        try:
+            val_str = f",{val:.4g}"
+        except (TypeError, ValueError) as err:
+            raise ValueError(f"Value must be a number, not {val!r}") from err
         if ts is None:
             if len(self.ts) == 0:
                 raise ValueError("The object need at least one timestamp")
@@ -228,6 +435,7 @@ class MqttData:
         elif isinstance(ts, str):
             if len(self.ts) == len(self.vals):
                 self.ts.append(ts)
+                self._size += len(ts) + 1
             else:
                 raise ValueError("The number of timestamps must be 1 or "\
                                  "match the number of samples")
@@ -235,7 +443,10 @@ class MqttData:
             raise ValueError("Timestamp must be of type str formatted "\
                              "as \"HH:MM:SS\"")
         self.vals.append(val)
-        return self._bufsize - len(self)
+        self._val_strs.append(val_str)
+        self._size += len(val_str)
+        self._cache = None
+        return self._bufsize - self._size
 
     def pop(self):
         """Pop the latest measurement from the object
@@ -248,26 +459,311 @@ class MqttData:
         ts = self.ts[-1]
         if len(self.vals) > 0:
             val = self.vals.pop()
+            self._size -= len(self._val_strs.pop())
             # If empty clear timestamp
             if len(self.vals) == 0:
                 ts = self.ts.pop()
+                self._size -= len(ts) + 1
             elif len(self.ts) > 1:
                 ts = self.ts.pop()
+                self._size -= len(ts) + 1
+            self._cache = None
         else:
             raise IndexError("pop from empty object")
 
-        return (val, ts, self._bufsize - len(self))
+        return (val, ts, self._bufsize - self._size)
 
     def serialize(self):
         """Serialize object to a ASCII string."""
-        output = self._ident
-        for val in self.vals:
-            output += f",{val:.4g}"
-        output += ",ts"
-        for ts in self.ts:
-            output += f",{ts}"
-        return output
+        if self._cache is None:
+            self._cache = self._ident + "".join(self._val_strs) \
+                + ",ts" + "".join("," + ts for ts in self.ts)
+        return self._cache
+
+    def serialize_binary(self, userid: str, scale: int | None = None) -> bytes:
+        """Serialize object to the compact binary wire format.
+
+        Parameters
+        -----
+        userid : str
+            User/group id, which is embedded in the header.
+        scale : int | None
+            None sends values as float32, otherwise values are sent as
+            integers of val * 10**scale.
+        """
+        return _encode_binary(userid, self._ident, self.vals, self.ts, scale)
+
+
+class CompactMqttData:
+    """Memory compact variant of MqttData for long buffering windows.
+
+    Values are stored as doubles in an ``array('d')`` and timestamps as
+    second offsets from ``base_epoch`` in an ``array('I')``. The object
+    serializes to exactly the same string as a MqttData with the same
+    content, but only accepts numeric values.
+
+    Timestamps can be given as \"HH:MM:SS\" strings, or as epoch seconds.
+    String timestamps are assumed to be non-decreasing, a timestamp earlier
+    than the previous one is treated as a rollover past midnight.
+    """
+    __slots__ = ("_ident", "_bufsize", "_base", "_vals", "_ts",
+                 "_size", "_cache")
+
+    def __init__(self,
+                 identifier: str,
+                 values: list | None = None,
+                 timestamps: str | int | list[str | int] | None = None,
+                 bufsize: int = 512,
+                 base_epoch: int | None = None
+                 ):
+        self._ident = identifier
+        self._bufsize = bufsize
+        if base_epoch is None:
+            # Midnight UTC, so "HH:MM:SS" maps directly to an offset.
+            base_epoch = int(time.time()) // 86400 * 86400
+        self._base = base_epoch
+        self._vals = array("d")
+        self._ts = array("I")
+        self._size = len(self._ident) + 3
+        self._cache = None
+
+        if values is None:
+            values = []
+        elif not isinstance(values, list):
+            raise ValueError("Values must be empty or list.")
+
+        if timestamps is None:
+            timestamps = []
+        elif isinstance(timestamps, (str, int)):
+            timestamps = [timestamps]
+        elif isinstance(timestamps, list):
+            if len(timestamps) != len(values):
+                raise ValueError(
+                    f"Timestamps have incorrect len {len(timestamps)}"\
+                    f"\nMust be 0,1 or Same as values.")
+
+        for ts in timestamps:
+            self._append_ts(ts)
+        for val in values:
+            self._append_val(val)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def identifier(self):
+        return self._ident
+
+    @property
+    def bufsize(self):
+        """Size of the transport buffer the object is measured against."""
+        return self._bufsize
+
+    @property
+    def base_epoch(self):
+        """Epoch in seconds, which the timestamps are offset from."""
+        return self._base
+
+    @property
+    def vals(self):
+        """Stored values"""
+        return self._vals
+
+    @property
+    def ts(self):
+        """Timestamps formatted as \"HH:MM:SS\" """
+        return [self._format_ts(offset) for offset in self._ts]
 
+    def _format_ts(self, offset: int) -> str:
+        sec = (self._base + offset) % 86400
+        return f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}"
+
+    def _append_ts(self, ts: str | int):
+        if isinstance(ts, str):
+            try:
+                hours, mins, secs = ts.split(":")
+                sec = int(hours) * 3600 + int(mins) * 60 + int(secs)
+            except ValueError as err:
+                raise ValueError("Timestamp must be of type str formatted "\
+                                 "as \"HH:MM:SS\" or epoch seconds") from err
+            offset = (sec - self._base) % 86400
+            if len(self._ts) > 0:
+                # Move forward in whole days, past the previous timestamp.
+                days = (self._ts[-1] - offset + 86399) // 86400
+                offset += max(days, 0) * 86400
+        elif isinstance(ts, int):
+            offset = ts - self._base
+        else:
+            raise ValueError("Timestamp must be of type str formatted "\
+                             "as \"HH:MM:SS\" or epoch seconds")
+        if offset < 0:
+            raise ValueError("Timestamp is before the base epoch")
+        self._ts.append(offset)
+        self._size += 9
+        self._cache = None
+
+    def _append_val(self, val: float):
+        self._vals.append(val)
+        self._size += len(f",{val:.4g}")
+        self._cache = None
+
+    def add_measurement(self,
+                        val: float,
+                        ts: None | str | int = None) -> int:
+        """Add measurement to data object
+
+        Params
+        -----
+        val : float
+            Numeric data point
+        ts : None | str | int
+            Timestamp associated with datapoint as \"HH:MM:SS\" or epoch
+            seconds, if None is giving, all points will use the first
+            timestamp.
+
+        Returns
+        -----
+        buffer_remainder : int
+            Remaining space, before object is bigger than MQTT buffer.
+
+        Raises
+        -----
+        ValueError
+          If the object has no associated timestamps and None is given.
+        ValueError
+          If there are less timestamps than samples but more than one.
+        ValueError
+          If the timestamp is not a valid format.
+        ValueError
+          If val is not a number, the object is left unchanged.
+        """
+        # Checked first, so a failure leaves the object unchanged
+        try:
+            val_size = len(f",{val:.4g}")
+        except (TypeError, ValueError) as err:
+            raise ValueError(f"Value must be a number, not {val!r}") from err
+        if ts is None:
+            if len(self._ts) == 0:
+                raise ValueError("The object need at least one timestamp")
+            if len(self._ts) > 1:
+                raise ValueError("The number of timestamps must be 1 or "\
+                                 "match the number of samples.")
+        elif len(self._ts) == len(self._vals):
+            self._append_ts(ts)
+        else:
+            raise ValueError("The number of timestamps must be 1 or "\
+                             "match the number of samples")
+        self._vals.append(val)
+        self._size += val_size
+        self._cache = None
+        return self._bufsize - self._size
+
+    def pop(self):
+        """Pop the latest measurement from the object
+
+        Returns
+        -----
+        val: float, ts: str, buffer_remainder: int
+        """
+        if len(self._vals) == 0:
+            raise IndexError("pop from empty object")
+        val = self._vals.pop()
+        self._size -= len(f",{val:.4g}")
+        ts = self._format_ts(self._ts[-1])
+        if len(self._vals) == 0 or len(self._ts) > 1:
+            self._ts.pop()
+            self._size -= 9
+        self._cache = None
+        return (val, ts, self._bufsize - self._size)
+
+    def serialize(self):
+        """Serialize object to a ASCII string."""
+        if self._cache is None:
+            self._cache = self._ident \
+                + "".join([f",{val:.4g}" for val in self._vals]) \
+                + ",ts" \
+                + "".join(["," + self._format_ts(ts) for ts in self._ts])
+        return self._cache
+
+    def serialize_binary(self, userid: str, scale: int | None = None) -> bytes:
+        """Serialize object to the compact binary wire format.
+
+        Parameters
+        -----
+        userid : str
+            User/group id, which is embedded in the header.
+        scale : int | None
+            None sends values as float32, otherwise values are sent as
+            integers of val * 10**scale.
+        """
+        return _encode_binary(userid, self._ident, self.vals, self.ts, scale)
+
+
+class MqttMultiData:
+    """Several MqttData objects sent as one message on the "multiple" topic.
+
+    The subscriber splits the payload on the identifiers, so identifiers
+    must not be numeric, "ts" or contain ":".
+    """
+    def __init__(self,
+                 data: list[MqttData] | None = None,
+                 bufsize: int = 512):
+        self._bufsize = bufsize
+        self.data: list[MqttData] = []
+        if data is not None:
+            for block in data:
+                self.add(block)
+
+    def __len__(self):
+        if len(self.data) == 0:
+            return 0
+        return sum(len(block) for block in self.data) + len(self.data) - 1
+
+    @property
+    def identifier(self):
+        return "multiple"
+
+    @property
+    def bufsize(self):
+        """Size of the transport buffer the object is measured against."""
+        return self._bufsize
+
+    def add(self, data: MqttData) -> int:
+        """Add a data object to the message
+
+        Returns
+        -----
+        buffer_remainder : int
+            Remaining space, before object is bigger than MQTT buffer.
+
+        Raises
+        -----
+        ValueError
+            If the data object is empty, or the identifier can not be
+            told apart from samples and timestamps.
+        """
+        ident = data.identifier
+        try:
+            float(ident)
+            numeric = True
+        except ValueError:
+            numeric = False
+        if numeric or ident == "ts" or ":" in ident:
+            raise ValueError(f"Identifier {ident} can not be used in a "\
+                             "multiple message")
+        if len(data.vals) == 0:
+            raise ValueError(f"{ident} contains no samples")
+        self.data.append(data)
+        return self._bufsize - len(self)
+
+    def serialize(self):
+        """Serialize object to a ASCII string."""
+        return ",".join(block.serialize() for block in self.data)
+
+    def serialize_binary(self, userid: str, scale: int | None = None):
+        """Not supported, the binary format holds a single identifier."""
+        raise ValueError("The binary format does not support multiple "\
+                         "identifiers")
 
 
 class _messaging:
@@ -282,8 +778,15 @@ class _messaging:
         self._port = port
         self.topic = topic
         self._keepalive = keepalive
+        self.compress: _compressions | None = None
+        """Compress payloads with "deflate" or "deflate-dict", see
+        _compress. None to send them as is."""
 
-    def send_topics(self, data: MqttData, qos: int = 0) -> None:
+    def send_topics(self,
+                    data: MqttData,
+                    qos: int = 0,
+                    binary: bool = False,
+                    scale: int | None = None) -> None:
         """Send Sensordata, to the MQTT server
         
         Parameters
@@ -292,13 +795,66 @@ class _messaging:
             Payload to publish to the MQTT Server
         qos : int
             0 At most one (default); 1 At least once; 2 Exactly once.
+        binary : bool
+            Send with the binary wire format under "<topic>bin/".
+        scale : int | None
+            Binary only, send values as integers of val * 10**scale
+            instead of float32.
         """
         raise NotImplementedError()
 
+    def _payload(self,
+                 data: MqttData,
+                 binary: bool,
+                 scale: int | None) -> tuple[str, str | bytes]:
+        """Return topic and payload for data"""
+        if binary:
+            topic = _BIN_TOPIC + data.identifier
+            output = data.serialize_binary(self._uid, scale)
+        else:
+            topic = data.identifier
+            output = self._uid + "," + data.serialize()
+        if self.compress is not None:
+            return (self.topic + _Z_TOPIC + topic,
+                    _compress(output, self.compress))
+        return self.topic + topic, output
+
     def publish(self, topic, payload):
         """Publish a MQTT message to the server"""
         raise NotImplementedError()
 
+    @property
+    def max_payload(self) -> int:
+        """Largest payload in bytes, which can be published."""
+        raise NotImplementedError()
+
+def _check_publish(info, qos: int, server, port: int):
+    """Raise for the return code of a paho publish, returns info
+
+    Raises
+    -----
+    queue.Full
+        If max_queued messages are already waiting.
+    IOError
+        If the client is not connected, for QoS 0.
+    """
+    import paho.mqtt.client as mqtt
+    if info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+        raise queue.Full("The publish queue is full")
+    if info.rc == mqtt.MQTT_ERR_NO_CONN:
+        if qos == 0:
+            raise IOError(f"Not connected to {server}:{port}")
+        # paho keeps QoS 1 and 2 messages and sends them after reconnecting,
+        # but leaves the return code, on which is_published raises.
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+    return info
+
+def _lost(info) -> bool:
+    """True for a message which will not be published, e.g. QoS 0 messages
+    not sent before the connection was lost. is_published raises for
+    these."""
+    return info.rc > 0
+
 class messaging_ip(_messaging):
     @staticmethod
     def _on_connect(client, userdata, flags, rc):
@@ -313,24 +869,145 @@ class messaging_ip(_messaging):
                  port: int = 1883,
                  topic: str = "aauiot/",
                  userid: str = "group", 
-                 keepalive: int = 600):
+                 keepalive: int = 600,
+                 max_payload: int = 512,
+                 max_inflight: int = 20,
+                 max_queued: int = 0,
+                 compress: _compressions | None = None):
+        """
+        Parameters
+        -----
+        max_payload : int
+            Largest payload used when batching.
+        max_inflight : int
+            QoS 1 and 2 messages sent, but not yet acknowledged. Further
+            messages are queued, until acknowledgements arrive.
+        max_queued : int
+            Maximum number of queued messages, 0 for unbounded. Publishing
+            to a full queue raises queue.Full.
+        compress : "deflate" | "deflate-dict" | None
+            Compress the payloads of send_topics, published under
+            "<topic>z/". "deflate-dict" uses a preset dictionary of common
+            identifiers and numbers, which helps most on short messages.
+
+        The network loop runs on a background thread, which sends the
+        messages, handles acknowledgements, keepalive and reconnects.
+        """
         super().__init__(server, port, topic, userid, keepalive)
+        self._max_payload = max_payload
+        self.compress = compress
+        import paho.mqtt.client as mqtt
         self.client = mqtt.Client()
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
+        self.client.max_inflight_messages_set(max_inflight)
+        self.client.max_queued_messages_set(max_queued)
+        self._outstanding: deque[mqtt.MQTTMessageInfo] = deque()
+        self.lost = 0
+        """QoS 0 messages not sent before the connection was lost"""
         self.client.connect(self._ip, self._port, self._keepalive)
+        self.client.loop_start()
 
     def discon(self):
         """Disconnect from MQTT"""
         self.client.disconnect()
+        self.client.loop_stop()
 
-    def publish(self, topic, payload):
-        self.client.publish(topic, payload)
+    def publish(self, topic, payload, qos: int = 0):
+        """Publish MQTT message
 
-    def send_topics(self, data: MqttData, qos: int = 0) -> None:
-        topic = self.topic + data.identifier
-        output = self._uid + "," + data.serialize()
-        self.client.publish(topic, output, qos)
+        Returns
+        -----
+        MQTTMessageInfo : Handle to wait for the message to be published.
+
+        Raises
+        -----
+        queue.Full
+            If max_queued messages are already waiting.
+        IOError
+            If the client is not connected, for QoS 0. QoS 1 and 2 messages
+            are queued, and sent after reconnecting.
+        """
+        info = _check_publish(self.client.publish(topic, payload, qos),
+                              qos, self._ip, self._port)
+        outstanding = self._outstanding
+        while outstanding and (_lost(outstanding[0])
+                               or outstanding[0].is_published()):
+            if _lost(outstanding.popleft()):
+                self.lost += 1
+        outstanding.append(info)
+        return info
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until all messages are published, and acknowledged for
+        QoS 1 and 2
+
+        Returns
+        -----
+        bool : False if the timeout passed first, or messages were lost
+            with the connection, see lost.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        outstanding = self._outstanding
+        lost = self.lost
+        while outstanding:
+            info = outstanding[0]
+            if not _lost(info):
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                try:
+                    info.wait_for_publish(remaining)
+                except RuntimeError:
+                    pass # Lost while waiting
+                if not _lost(info) and not info.is_published():
+                    return False
+            if _lost(outstanding.popleft()):
+                self.lost += 1
+        return self.lost == lost
+
+    @property
+    def max_payload(self) -> int:
+        """Largest payload used when batching, configurable for IP."""
+        return self._max_payload
+
+    @max_payload.setter
+    def max_payload(self, size: int):
+        self._max_payload = size
+
+    def send_topics(self,
+                    data: MqttData,
+                    qos: int = 0,
+                    binary: bool = False,
+                    scale: int | None = None):
+        """See _messaging.send_topics
+
+        Returns
+        -----
+        MQTTMessageInfo : Handle to wait for the message to be published.
+        """
+        topic, output = self._payload(data, binary, scale)
+        return self.publish(topic, output, qos)
+
+
+def _sample_count(data: MqttData | MqttMultiData) -> int:
+    if isinstance(data, MqttMultiData):
+        return sum(len(block.vals) for block in data.data)
+    return len(data.vals)
+
+def _count_sent(sent: dict[str, int], samples: int, size: int):
+    sent["messages"] += 1
+    sent["samples"] += samples
+    sent["payload_bytes"] += size
+
+def _nbiot_stats(sim, sent: dict[str, int]) -> dict:
+    stats = dict(sent)
+    stats["payload_bytes_per_sample"] = \
+        sent["payload_bytes"] / sent["samples"] if sent["samples"] else 0.0
+    stats["at"] = sim.stats.snapshot()
+    return stats
 
 
 class messaging_nbiot(_messaging):
@@ -340,54 +1017,1393 @@ class messaging_nbiot(_messaging):
                  topic: str = "aauiot/",
                  userid: str = "group",
                  keepalive: int = 600,
-                 device = "/dev/ttyAMA0"):
+                 device = "/dev/ttyAMA0",
+                 queue_size: int = 16,
+                 attach_timeout: float = 120,
+                 resume: bool = False):
+        """
+        Parameters
+        -----
+        attach_timeout : float
+            Seconds to wait for the network, before raising TimeoutError.
+        resume : bool
+            Reuse the network attachment and MQTT session of a previous run
+            to the same server, instead of attaching again. The userid and
+            keepalive must be the same as in that run.
+
+        The time spent attaching is kept in ``timings``, see _connect_sim.
+        """
         super().__init__(server, port, topic, userid, keepalive)
-        self.sim = Sim7020x(device)
+        from aauiot._sim7020e import Sim7020x, AtCommandWorker
+        self.sim = Sim7020x(device, keep_session=resume)
+        self._attach_timeout = attach_timeout
+        self._resume = resume
+        self.timings: dict[str, float] = {}
+        self._sent = {"messages": 0, "samples": 0, "payload_bytes": 0}
         self._connect_sim()
+        # All modem commands are run by the worker from here on.
+        self._worker = AtCommandWorker(self.sim, queue_size)
 
     def _connect_sim(self):
+        """Attach to the network and connect the MQTT session
+
+        Fills ``timings`` with seconds from enabling RF: "attach" until the
+        PDP context is up, "mqtt_connect" until the session is ready and
+        later "first_publish" when the first message has been published.
+        A resumed session only records "resume" and "first_publish".
+        """
+        if self._resume:
+            self._t_rf = time.monotonic()
+            if self.sim.resume_session(self._ip):
+                self.timings["resume"] = time.monotonic() - self._t_rf
+                return
+            self.sim.mqtt_teardown()
         self.sim.disable_rf()
         self.sim.set_cops_short(23802)
         self.sim.set_default_psd("IP", "telenor.iot")
+        self.sim.enable_registration_urcs()
+        self._t_rf = time.monotonic()
         self.sim.enable_rf()
-        while self.sim.connected_network() is False:
-            pass
+        self.sim.wait_network(self._attach_timeout)
+        self.timings["attach"] = time.monotonic() - self._t_rf
         self.sim.mqtt_new(self._ip, self._port)
         self.sim.mqtt_connection("MQTT 3.1", self._uid, self._keepalive)
+        self.timings["mqtt_connect"] = time.monotonic() - self._t_rf
+
+    def _first_publish(self, future: Future):
+        if "first_publish" not in self.timings and future.exception() is None:
+            self.timings["first_publish"] = time.monotonic() - self._t_rf
 
     def discon(self):
         """Disconnect from MQTT and disable RF"""
-        self.sim.mqtt_discon()
-        self.sim.disable_rf()
+        self._worker.submit(self.sim.mqtt_discon).result()
+        self._worker.submit(self.sim.disable_rf).result()
+        self._worker.shutdown()
 
     def publish(self, topic, payload):
         """Publish MQTT message"""
-        self.sim.mqtt_publish(topic, payload)
+        self.publish_async(topic, payload, block=True).result()
+
+    def publish_async(self,
+                      topic: str,
+                      payload: str | bytes,
+                      qos: int = 2,
+                      callback: Callable[[Future], None] | None = None,
+                      block: bool = False) -> Future:
+        """Queue a MQTT message, without waiting for the modem.
+
+        Parameters
+        -----
+        topic : str
+            MQTT Topic
+        payload : str | bytes
+            Message to publish, bytes are sent in the modem hex mode.
+        qos : int
+            0 At most one; 1 At least once; 2 Exactly once (default).
+        callback : Callable[[Future], None] | None
+            Called with the future, when the publish has completed.
+        block : bool
+            Wait for room in the queue, instead of raising queue.Full.
+
+        Returns
+        -----
+        Future : Result is the AtMsg reply, or the raised exception.
+
+        Raises
+        -----
+        queue.Full
+            If the queue is full and block is not set.
+        """
+        future = self._worker.submit(self.sim.mqtt_publish, topic, payload,
+                                     qos, block=block)
+        if "first_publish" not in self.timings:
+            future.add_done_callback(self._first_publish)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
 
-    def send_topics(self, data: MqttData, qos: int = 0) -> None:
-        topic = self.topic + data.identifier
-        output = self._uid + "," + data.serialize()
-        self.sim.mqtt_publish(topic, output, qos)
+    @property
+    def max_payload(self) -> int:
+        """Largest payload, given by the modem MQTT buffer. Binary payloads
+        are hex encoded, so at most half of it in bytes."""
+        return self.sim._mqtt_buffer
+
+    def send_topics(self,
+                    data: MqttData,
+                    qos: int = 0,
+                    binary: bool = False,
+                    scale: int | None = None) -> None:
+        self.send_topics_async(data, qos, binary, scale, block=True).result()
+
+    def send_topics_async(self,
+                          data: MqttData,
+                          qos: int = 0,
+                          binary: bool = False,
+                          scale: int | None = None,
+                          callback: Callable[[Future], None] | None = None,
+                          block: bool = False) -> Future:
+        """Queue Sensordata for the MQTT server, see send_topics and
+        publish_async.
+
+        Raises
+        -----
+        queue.Full
+            If the queue is full and block is not set.
+        """
+        topic, output = self._payload(data, binary, scale)
+        samples = _sample_count(data)
+
+        def sent(future: Future):
+            if future.exception() is None:
+                _count_sent(self._sent, samples, len(output))
+            if callback is not None:
+                callback(future)
+
+        return self.publish_async(topic, output, qos, sent, block)
+
+    def stats(self) -> dict:
+        """Modem command counters and the published payload
+
+        Returns
+        -----
+        dict : "at" is the Sim7020x.stats snapshot, next to the messages,
+            samples and payload_bytes sent with send_topics and the
+            payload_bytes_per_sample.
+        """
+        return _nbiot_stats(self.sim, self._sent)
+
+
+class messaging_ip_async(_messaging):
+    """MQTT over IP for asyncio
+
+    Create with ``await messaging_ip_async.create(server, ...)``. The paho
+    socket is served by the event loop, so publishing never blocks it.
+    Only the TCP connects are blocking. A lost connection is reconnected,
+    with a backoff of up to ``max_backoff`` seconds.
+    """
+    max_backoff = 60
+    def __init__(self,
+                 server,
+                 port: int = 1883,
+                 topic: str = "aauiot/",
+                 userid: str = "group",
+                 keepalive: int = 600,
+                 max_payload: int = 512,
+                 compress: _compressions | None = None):
+        super().__init__(server, port, topic, userid, keepalive)
+        self._max_payload = max_payload
+        self.compress = compress
+        self.client = None
+        self._misc_task = None
+
+    @property
+    def max_payload(self) -> int:
+        """Largest payload used when batching, configurable for IP."""
+        return self._max_payload
+
+    @max_payload.setter
+    def max_payload(self, size: int):
+        self._max_payload = size
+
+    @classmethod
+    async def create(cls,
+                     server,
+                     port: int = 1883,
+                     topic: str = "aauiot/",
+                     userid: str = "group",
+                     keepalive: int = 600,
+                     max_payload: int = 512,
+                     compress: _compressions | None = None):
+        """Connect to the MQTT server"""
+        self = cls(server, port, topic, userid, keepalive, max_payload,
+                   compress)
+        self._connect()
+        return self
+
+    def _connect(self):
+        import asyncio
+        import paho.mqtt.client as mqtt
+        loop = asyncio.get_running_loop()
+        client = mqtt.Client()
+        client.on_connect = messaging_ip._on_connect
+        client.on_message = messaging_ip._on_message
+        client.on_socket_open = \
+            lambda client, userdata, sock: loop.add_reader(sock,
+                                                           client.loop_read)
+        client.on_socket_close = \
+            lambda client, userdata, sock: loop.remove_reader(sock)
+        client.on_socket_register_write = \
+            lambda client, userdata, sock: loop.add_writer(sock,
+                                                           client.loop_write)
+        client.on_socket_unregister_write = \
+            lambda client, userdata, sock: loop.remove_writer(sock)
+        self.client = client
+        client.connect(self._ip, self._port, self._keepalive)
+        self._misc_task = loop.create_task(self._misc_loop())
+
+    async def _misc_loop(self):
+        """Keepalive and retries, which paho runs once a second, and
+        reconnecting when the connection is lost"""
+        import asyncio
+        import paho.mqtt.client as mqtt
+        backoff = 1
+        while True:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                backoff = 1
+                await asyncio.sleep(1)
+                continue
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+            try:
+                # Queued QoS 1 and 2 messages are sent again once connected
+                self.client.reconnect()
+            except OSError:
+                pass
+
+    async def discon(self):
+        """Disconnect from MQTT"""
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+        self.client.disconnect()
+
+    async def publish(self, topic, payload, qos: int = 0):
+        """Publish MQTT message, see messaging_ip.publish
+
+        Raises
+        -----
+        queue.Full
+            If max_queued messages are already waiting.
+        IOError
+            If the client is not connected, for QoS 0. QoS 1 and 2 messages
+            are queued, and sent after reconnecting.
+        """
+        return _check_publish(self.client.publish(topic, payload, qos),
+                              qos, self._ip, self._port)
+
+    async def send_topics(self,
+                          data: MqttData,
+                          qos: int = 0,
+                          binary: bool = False,
+                          scale: int | None = None):
+        """See _messaging.send_topics
+
+        Returns
+        -----
+        paho.mqtt.client.MQTTMessageInfo
+
+        Raises
+        -----
+        queue.Full | IOError
+            See publish.
+        """
+        topic, output = self._payload(data, binary, scale)
+        return await self.publish(topic, output, qos)
+
+
+class messaging_nbiot_async(_messaging):
+    """MQTT over NB-IoT for asyncio
+
+    Create with ``await messaging_nbiot_async.create(server, ...)``.
+    """
+    def __init__(self,
+                 server,
+                 port: int = 1883,
+                 topic: str = "aauiot/",
+                 userid: str = "group",
+                 keepalive: int = 600,
+                 attach_timeout: float = 120,
+                 resume: bool = False):
+        super().__init__(server, port, topic, userid, keepalive)
+        self.sim = None
+        self._attach_timeout = attach_timeout
+        self._resume = resume
+        self.timings: dict[str, float] = {}
+        self._sent = {"messages": 0, "samples": 0, "payload_bytes": 0}
+
+    @classmethod
+    async def create(cls,
+                     server,
+                     port: int = 1883,
+                     topic: str = "aauiot/",
+                     userid: str = "group",
+                     keepalive: int = 600,
+                     device = "/dev/ttyAMA0",
+                     attach_timeout: float = 120,
+                     resume: bool = False):
+        """Attach to the network and connect to the MQTT server, see
+        messaging_nbiot"""
+        from aauiot._sim7020e import AsyncSim7020x
+        self = cls(server, port, topic, userid, keepalive, attach_timeout,
+                   resume)
+        self.sim = await AsyncSim7020x.create(device, keep_session=resume)
+        await self._connect_sim()
+        return self
+
+    async def _connect_sim(self):
+        """See messaging_nbiot._connect_sim"""
+        if self._resume:
+            self._t_rf = time.monotonic()
+            if await self.sim.resume_session(self._ip):
+                self.timings["resume"] = time.monotonic() - self._t_rf
+                return
+            await self.sim.mqtt_teardown()
+        await self.sim.disable_rf()
+        await self.sim.set_cops_short(23802)
+        await self.sim.set_default_psd("IP", "telenor.iot")
+        await self.sim.enable_registration_urcs()
+        self._t_rf = time.monotonic()
+        await self.sim.enable_rf()
+        await self.sim.wait_network(self._attach_timeout)
+        self.timings["attach"] = time.monotonic() - self._t_rf
+        await self.sim.mqtt_new(self._ip, self._port)
+        await self.sim.mqtt_connection("MQTT 3.1", self._uid, self._keepalive)
+        self.timings["mqtt_connect"] = time.monotonic() - self._t_rf
+
+    async def _publish(self, topic, payload, qos=2):
+        reply = await self.sim.mqtt_publish(topic, payload, qos)
+        if "first_publish" not in self.timings:
+            self.timings["first_publish"] = time.monotonic() - self._t_rf
+        return reply
+
+    async def discon(self):
+        """Disconnect from MQTT and disable RF"""
+        await self.sim.mqtt_discon()
+        await self.sim.disable_rf()
+        self.sim.close()
+
+    async def publish(self, topic, payload):
+        """Publish MQTT message"""
+        return await self._publish(topic, payload)
+
+    @property
+    def max_payload(self) -> int:
+        """Largest payload, given by the modem MQTT buffer. Binary payloads
+        are hex encoded, so at most half of it in bytes."""
+        return self.sim._mqtt_buffer
+
+    async def send_topics(self,
+                          data: MqttData,
+                          qos: int = 0,
+                          binary: bool = False,
+                          scale: int | None = None):
+        """See _messaging.send_topics
+
+        Returns
+        -----
+        AtMsg : Reply from the modem
+        """
+        topic, output = self._payload(data, binary, scale)
+        reply = await self._publish(topic, output, qos)
+        _count_sent(self._sent, _sample_count(data), len(output))
+        return reply
+
+    def stats(self) -> dict:
+        """See messaging_nbiot.stats"""
+        return _nbiot_stats(self.sim, self._sent)
+
+
+class MqttBatcher:
+    """Pack samples into messages, which fit the transport buffer.
+
+    Samples are collected per identifier and a message is sent when it is
+    full, when its oldest sample is older than ``max_age`` or on ``flush``.
+    """
+    def __init__(self,
+                 mqtt: _messaging,
+                 qos: int = 0,
+                 max_age: float | None = None,
+                 single_ts: bool = False,
+                 bufsize: int | None = None,
+                 combine: bool = False):
+        """
+        Parameters
+        -----
+        mqtt : messaging_ip | messaging_nbiot
+            Transport used to send the messages.
+        qos : int
+            MQTT QoS used for every message.
+        max_age : float | None
+            Maximum age in seconds of a pending message, None to only flush
+            on size or on demand.
+        single_ts : bool
+            Only transmit the timestamp of the first sample in a message.
+        bufsize : int | None
+            Message limit in bytes, defaults to the transport max_payload.
+        combine : bool
+            Pack all identifiers into shared messages on the "multiple"
+            topic, instead of one message per identifier.
+        """
+        self._mqtt = mqtt
+        self._qos = qos
+        self._max_age = max_age
+        self._single_ts = single_ts
+        self._bufsize = bufsize
+        self._combine = combine
+        self._pending: dict[str, MqttData] = {}
+        self._created: dict[str, float] = {}
+
+    def __len__(self):
+        """Number of pending messages"""
+        return len(self._pending)
+
+    def _limit(self) -> int:
+        bufsize = self._bufsize
+        if bufsize is None:
+            bufsize = self._mqtt.max_payload
+        # send_topics prefixes the payload with "<userid>,"
+        return bufsize - len(self._mqtt._uid) - 1
+
+    def _new_data(self, identifier: str) -> MqttData:
+        data = MqttData(identifier, bufsize=self._limit())
+        self._pending[identifier] = data
+        self._created[identifier] = time.monotonic()
+        return data
+
+    def _add(self, data: MqttData, val: object, ts: str) -> int:
+        if self._single_ts and len(data.ts) > 0:
+            remainder = data.add_measurement(val)
+        else:
+            remainder = data.add_measurement(val, ts)
+        if self._combine:
+            size = sum(len(block) for block in self._pending.values())
+            remainder = data.bufsize - size - (len(self._pending) - 1)
+        return remainder
+
+    def add(self, identifier: str, val: object, ts: str | None = None):
+        """Add a sample, and send messages which are full or too old.
+
+        Parameters
+        -----
+        identifier : str
+            Sensor identifier, each identifier is sent as its own message
+            unless combine is set.
+        val : object
+            Data which can be represented as a string
+        ts : str | None
+            Timestamp formatted as "HH:MM:SS", None for the current time.
+
+        Raises
+        -----
+        ValueError
+            If a single sample does not fit in a message.
+        """
+        if ts is None:
+            ts = _get_time()
+        data = self._pending.get(identifier)
+        if data is None:
+            data = self._new_data(identifier)
+
+        # Identifiers flushed together when the buffer is full
+        scope = None if self._combine else identifier
+        remainder = self._add(data, val, ts)
+        if remainder < 0 and (len(data.vals) > 1 or len(self._pending) > 1):
+            data.pop()
+            self.flush(scope)
+            data = self._new_data(identifier)
+            remainder = self._add(data, val, ts)
+        if remainder < 0:
+            self._pending.pop(identifier)
+            self._created.pop(identifier)
+            raise ValueError(f"Sample for {identifier} exceeds the "\
+                             f"buffer of {data.bufsize} bytes")
+        if remainder == 0:
+            self.flush(scope)
+        self.poll()
+
+    def poll(self):
+        """Send pending messages older than max_age"""
+        if self._max_age is None:
+            return
+        now = time.monotonic()
+        for identifier, created in list(self._created.items()):
+            if now - created >= self._max_age:
+                self.flush(None if self._combine else identifier)
+
+    def flush(self, identifier: str | None = None):
+        """Send pending messages
+
+        Parameters
+        -----
+        identifier : str | None
+            Only send the message for this identifier, None sends all.
+        """
+        if identifier is None:
+            identifiers = list(self._pending)
+        else:
+            identifiers = [identifier]
+        blocks = []
+        for ident in identifiers:
+            data = self._pending.pop(ident, None)
+            self._created.pop(ident, None)
+            if data is not None and len(data.vals) > 0:
+                blocks.append(data)
+
+        if not self._combine:
+            for data in blocks:
+                self._mqtt.send_topics(data, self._qos)
+            return
+
+        message = MqttMultiData(bufsize=self._limit())
+        for data in blocks:
+            if message.add(data) < 0 and len(message.data) > 1:
+                message.data.pop()
+                self._send_multi(message)
+                message = MqttMultiData([data], self._limit())
+        self._send_multi(message)
+
+    def _send_multi(self, message: MqttMultiData):
+        if len(message.data) == 1:
+            self._mqtt.send_topics(message.data[0], self._qos)
+        elif len(message.data) > 1:
+            self._mqtt.send_topics(message, self._qos)
+
+def _downsample(first: MqttData,
+                second: MqttData,
+                weights: list[int]) -> tuple[MqttData, list[int]]:
+    """Merge two messages, averaging pairs of consecutive samples
+
+    Parameters
+    -----
+    first: MqttData
+        Older message
+    second: MqttData
+        Newer message
+    weights: list[int]
+        Number of original samples each value of first and second stands
+        for, in order
+
+    Returns
+    -----
+    tuple[MqttData, list[int]]
+        The merged message, and the weights of its values. Each average
+        carries the timestamp of its first sample.
+    """
+    vals = list(first.vals) + list(second.vals)
+    merged_vals = []
+    merged_weights = []
+    for idx in range(0, len(vals), 2):
+        pair_weights = weights[idx:idx + 2]
+        total = sum(pair_weights)
+        merged_vals.append(sum(val * weight for val, weight
+                               in zip(vals[idx:idx + 2], pair_weights))
+                           / total)
+        merged_weights.append(total)
+    if len(first.ts) == 1 and len(second.ts) == 1 \
+            and (len(first.vals) > 1 or len(second.vals) > 1):
+        # Only the first timestamp is sent, see MqttBatcher single_ts
+        return MqttData(first.identifier, merged_vals, first.ts[0],
+                        first.bufsize), merged_weights
+    # One timestamp per sample, a single timestamp covers all samples
+    ts = []
+    for data in (first, second):
+        if len(data.ts) == 1:
+            ts.extend(data.ts * len(data.vals))
+        else:
+            ts.extend(data.ts)
+    return MqttData(first.identifier, merged_vals, ts[::2],
+                    first.bufsize), merged_weights
+
+
+class MemoryOutbox:
+    """Bounded queue of messages in front of a transport
+
+    Messages are sent in order by a background thread, so send_topics
+    returns at once while the link is slow. When the queue is full the
+    policy decides what happens to a new message:
+
+    - "block": Wait for room, or raise queue.Full after timeout.
+    - "drop-oldest": Discard the oldest queued message.
+    - "drop-newest": Discard the new message.
+    - "downsample": Merge the oldest two queued messages of an identifier,
+      averaging pairs of samples weighted by the number of samples each
+      stands for, else discard the oldest message. An average carries the
+      timestamp of the first sample it covers.
+
+    Failed sends, IOError or queue.Full from the transport, are retried
+    after ``retry`` seconds. Messages the transport rejects with
+    ValueError, e.g. too large, are dropped. Any other exception stops the
+    thread, it is kept in ``error`` and the message stays queued. Can be
+    used in place of the transport for MqttBatcher.
+    """
+    _policies = Literal["block", "drop-oldest", "drop-newest", "downsample"]
+
+    def __init__(self,
+                 mqtt: _messaging,
+                 max_messages: int = 64,
+                 max_bytes: int | None = None,
+                 policy: _policies = "block",
+                 timeout: float | None = None,
+                 retry: float = 5):
+        """
+        Parameters
+        -----
+        mqtt : messaging_ip | messaging_nbiot
+            Transport used to send the messages.
+        max_messages : int
+            Maximum number of queued messages.
+        max_bytes : int | None
+            Maximum size of the queued payloads in bytes, None for no limit.
+        policy : "block" | "drop-oldest" | "drop-newest" | "downsample"
+            What to do with a message when the queue is full.
+        timeout : float | None
+            Seconds send_topics blocks with the "block" policy, None to wait
+            until there is room.
+        retry : float
+            Seconds to wait after a failed send, before trying again.
+        """
+        if policy not in MemoryOutbox._policies.__args__:
+            raise ValueError(f"Invalid policy: must be in: "\
+                             f"{MemoryOutbox._policies.__args__}")
+        self._mqtt = mqtt
+        self._uid = mqtt._uid
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._policy = policy
+        self._timeout = timeout
+        self._retry = retry
+        # Queued (data, qos, binary, scale, weights, size), weights of the
+        # downsampled values, None while each value is one sample
+        self._queue: deque[tuple] = deque()
+        self._bytes = 0
+        self._sending = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.sent = 0
+        """Messages sent"""
+        self.dropped = 0
+        """Messages discarded by the policy, or rejected by the transport"""
+        self.merged = 0
+        """Messages merged into another by downsampling"""
+        self.failures = 0
+        """Sends which raised IOError or queue.Full"""
+        self.error: Exception | None = None
+        """Unexpected exception which stopped the sending thread"""
+        self.start()
+
+    def __len__(self):
+        """Number of queued messages"""
+        return len(self._queue)
+
+    @property
+    def max_payload(self) -> int:
+        return self._mqtt.max_payload
+
+    @property
+    def queued_bytes(self) -> int:
+        """Size of the queued payloads in bytes"""
+        return self._bytes
+
+    def stats(self) -> dict:
+        """Queue depth and counters"""
+        with self._cond:
+            return {"depth": len(self._queue), "queued_bytes": self._bytes,
+                    "sent": self.sent, "dropped": self.dropped,
+                    "merged": self.merged, "failures": self.failures,
+                    "error": self.error}
+
+    @property
+    def running(self) -> bool:
+        """True while the sending thread is active"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sending on a background thread"""
+        if self.running:
+            return
+        self._stop = False
+        self.error = None
+        self._thread = threading.Thread(target=self._run,
+                                        name="aauiot-outbox",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """Send the queued messages and stop, messages left after timeout
+        or an unexpected error stay queued"""
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while (self._queue or self._sending) and self.error is None:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                self._cond.wait(remaining)
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _full(self, size: int) -> bool:
+        if len(self._queue) >= self._max_messages:
+            return True
+        return self._max_bytes is not None and len(self._queue) > 0 \
+            and self._bytes + size > self._max_bytes
+
+    def _pop_oldest(self):
+        entry = self._queue.popleft()
+        self._bytes -= entry[-1]
+        self.dropped += 1
+
+    def _merge_oldest(self) -> bool:
+        """Downsample the oldest two messages of an identifier"""
+        for idx, first in enumerate(self._queue):
+            if not isinstance(first[0], MqttData) or len(first[0].vals) == 0:
+                continue
+            for jdx in range(idx + 1, len(self._queue)):
+                second = self._queue[jdx]
+                if isinstance(second[0], MqttData) \
+                        and second[0].identifier == first[0].identifier \
+                        and second[1:4] == first[1:4] \
+                        and len(second[0].vals) > 0:
+                    weights = (first[4] or [1] * len(first[0].vals)) \
+                        + (second[4] or [1] * len(second[0].vals))
+                    data, weights = _downsample(first[0], second[0], weights)
+                    size = len(data)
+                    del self._queue[jdx]
+                    self._queue[idx] = (data, *first[1:4], weights, size)
+                    self._bytes += size - first[-1] - second[-1]
+                    self.merged += 1
+                    return True
+        return False
+
+    def send_topics(self,
+                    data: MqttData,
+                    qos: int = 0,
+                    binary: bool = False,
+                    scale: int | None = None) -> None:
+        """Queue a message, see _messaging.send_topics and the policy
+
+        Raises
+        -----
+        queue.Full
+            With the "block" policy, if there is no room within timeout.
+        """
+        size = len(data)
+        with self._cond:
+            if self._policy == "block":
+                if not self._cond.wait_for(lambda: not self._full(size),
+                                           self._timeout):
+                    raise queue.Full(f"Outbox of {self._max_messages} "\
+                                     "messages is full")
+            elif self._policy == "drop-newest":
+                if self._full(size):
+                    self.dropped += 1
+                    return
+            else:
+                while self._full(size):
+                    if self._policy == "downsample" and self._merge_oldest():
+                        continue
+                    self._pop_oldest()
+            self._queue.append((data, qos, binary, scale, None, size))
+            self._bytes += size
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._stop)
+                if self._stop:
+                    return
+                entry = self._queue.popleft()
+                self._bytes -= entry[-1]
+                self._sending = 1
+                self._cond.notify_all()
+            try:
+                self._mqtt.send_topics(*entry[:4])
+            except (IOError, queue.Full):
+                with self._cond:
+                    self.failures += 1
+                    # Keep the order, it is sent again after the delay
+                    self._queue.appendleft(entry)
+                    self._bytes += entry[-1]
+                    self._sending = 0
+                    self._cond.wait_for(lambda: self._stop, self._retry)
+                continue
+            except ValueError:
+                # A message the transport can not send, e.g. too large for
+                # the modem buffer. It would fail again, so it is dropped
+                # instead of stopping the queue.
+                with self._cond:
+                    self.dropped += 1
+                    self._sending = 0
+                    self._cond.notify_all()
+                continue
+            except Exception as err:
+                # Unexpected, keep the message and stop sending
+                with self._cond:
+                    self.error = err
+                    self._queue.appendleft(entry)
+                    self._bytes += entry[-1]
+                    self._sending = 0
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self.sent += 1
+                self._sending = 0
+                self._cond.notify_all()
+
+class messaging_auto(_messaging):
+    """IP with NB-IoT failover
+
+    Keeps a messaging_ip and a messaging_nbiot connection, and sends over
+    IP while it is healthy. IP is marked failed when a publish raises or
+    is lost with the connection, the client loses the connection, or a
+    message is not acknowledged within ``latency``. The messages not yet acknowledged are then sent again over
+    NB-IoT, in order, so messages can arrive twice around a failover, as
+    for QoS 1. While on NB-IoT the IP connection is checked every
+    ``probe_interval`` seconds, and used again once it is back.
+
+    Only messages with a QoS of at least ``failover_qos`` are sent over
+    NB-IoT. The others are kept queued for IP, and are the first to be
+    dropped when the queue is full.
+
+    Messages are sent by a background thread, like MemoryOutbox, so
+    send_topics does not wait for the link.
+    """
+    def __init__(self,
+                 server,
+                 port: int = 1883,
+                 topic: str = "aauiot/",
+                 userid: str = "group",
+                 keepalive: int = 600,
+                 device = "/dev/ttyAMA0",
+                 resume: bool = False,
+                 max_messages: int = 256,
+                 timeout: float | None = None,
+                 latency: float = 5,
+                 failover_qos: int = 1,
+                 probe_interval: float = 10,
+                 retry: float = 30):
+        """
+        Parameters
+        -----
+        device : str
+            Modem serial port, see messaging_nbiot.
+        resume : bool
+            Resume the NB-IoT session of a previous run, see messaging_nbiot.
+        max_messages : int
+            Maximum number of queued messages.
+        timeout : float | None
+            Seconds send_topics waits for room in a full queue, None to wait
+            until there is room.
+        latency : float
+            Seconds a message may wait for its IP acknowledgement, before
+            IP is considered failed.
+        failover_qos : int
+            Lowest QoS of messages sent over NB-IoT.
+        probe_interval : float
+            Seconds between checks of a failed link.
+        retry : float
+            Seconds to wait after a failed NB-IoT publish, before trying
+            again.
+
+        Raises
+        -----
+        IOError
+            If neither link can be connected.
+        """
+        super().__init__(server, port, topic, userid, keepalive)
+        self._device = device
+        self._resume = resume
+        self._max_messages = max_messages
+        self._timeout = timeout
+        self._latency = latency
+        self._failover_qos = failover_qos
+        self._probe_interval = probe_interval
+        self._retry = retry
+        self.ip: messaging_ip | None = None
+        self.nbiot: messaging_nbiot | None = None
+        self._connect_ip()
+        self._connect_nbiot()
+        if self.ip is None and self.nbiot is None:
+            raise IOError(f"Neither IP nor NB-IoT could connect to {server}")
+        self._ip_ok = self.ip is not None
+        self._probe_at = time.monotonic() + probe_interval
+        self._nbiot_retry_at = 0.0
+        # Queued (data, qos, binary, scale)
+        self._queue: deque[tuple] = deque()
+        # Sent over IP, waiting for the acknowledgement (sent at, info, entry)
+        self._pending: deque[tuple] = deque()
+        self._sending = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self.sent = {"IP": 0, "NBIoT": 0}
+        """Messages sent over each link"""
+        self.failovers = 0
+        self.failbacks = 0
+        self.resent = 0
+        """Messages sent over IP, and again over NB-IoT after a failover"""
+        self.dropped = 0
+        """Messages below failover_qos, discarded while the queue was full"""
+        self.failures = 0
+        """NB-IoT publishes which raised IOError"""
+        self._thread = threading.Thread(target=self._run, name="aauiot-auto",
+                                        daemon=True)
+        self._thread.start()
+
+    def _connect_ip(self):
+        try:
+            self.ip = messaging_ip(self._ip, self._port, self.topic,
+                                   self._uid, self._keepalive)
+        except OSError:
+            self.ip = None
+
+    def _connect_nbiot(self):
+        try:
+            self.nbiot = messaging_nbiot(self._ip, self._port, self.topic,
+                                         self._uid, self._keepalive,
+                                         device=self._device,
+                                         resume=self._resume)
+        except OSError:
+            self.nbiot = None
+
+    def __len__(self):
+        """Number of queued messages"""
+        return len(self._queue)
+
+    @property
+    def link(self) -> str:
+        """Link messages are sent over, "IP" or "NBIoT" """
+        return "IP" if self._ip_ok else "NBIoT"
+
+    @property
+    def max_payload(self) -> int:
+        """Largest payload both links can publish"""
+        sizes = [link.max_payload for link in (self.ip, self.nbiot)
+                 if link is not None]
+        return min(sizes)
+
+    def stats(self) -> dict:
+        """Current link, queue depth and counters"""
+        with self._cond:
+            return {"link": self.link, "depth": len(self._queue),
+                    "sent": dict(self.sent), "failovers": self.failovers,
+                    "failbacks": self.failbacks, "resent": self.resent,
+                    "dropped": self.dropped, "failures": self.failures}
+
+    def publish(self, topic, payload):
+        """Publish a MQTT message over the current link, without queueing"""
+        if self._ip_ok:
+            self.ip.publish(topic, payload)
+        elif self.nbiot is not None:
+            self.nbiot.publish(topic, payload)
+        else:
+            raise IOError("No link is available")
+
+    def _full(self) -> bool:
+        return len(self._queue) >= self._max_messages
+
+    def _drop_held(self) -> bool:
+        """Drop the oldest message, which is not sent over NB-IoT"""
+        for idx, entry in enumerate(self._queue):
+            if entry[1] < self._failover_qos:
+                del self._queue[idx]
+                self.dropped += 1
+                return True
+        return False
+
+    def send_topics(self,
+                    data: MqttData,
+                    qos: int = 0,
+                    binary: bool = False,
+                    scale: int | None = None) -> None:
+        """Queue a message, see _messaging.send_topics
+
+        Raises
+        -----
+        queue.Full
+            If there is no room within timeout.
+        """
+        with self._cond:
+            while self._full() and not self._ip_ok and self._drop_held():
+                pass
+            if not self._cond.wait_for(lambda: not self._full(),
+                                       self._timeout):
+                raise queue.Full(f"Queue of {self._max_messages} messages "\
+                                 "is full")
+            self._queue.append((data, qos, binary, scale))
+            self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until the queued messages are sent, and acknowledged over IP
+
+        Returns
+        -----
+        bool : False if the timeout passed first.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not (self._queue or self._sending or self._pending),
+                timeout)
+
+    def discon(self, timeout: float | None = None):
+        """Send the queued messages, and disconnect both links. Messages
+        left after timeout are discarded"""
+        self.flush(timeout)
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+        for link in (self.ip, self.nbiot):
+            if link is not None:
+                link.discon()
+
+    # ----- Sending thread -----
+
+    def _fail_ip(self):
+        """Switch to NB-IoT, and queue the unacknowledged messages again"""
+        self._ip_ok = False
+        self.failovers += 1
+        self._probe_at = time.monotonic() + self._probe_interval
+        while self._pending:
+            _, info, entry = self._pending.pop()
+            if _lost(info) or not info.is_published():
+                self._queue.appendleft(entry)
+                self.resent += 1
+
+    def _check_ip(self):
+        now = time.monotonic()
+        if self._ip_ok:
+            pending = self._pending
+            while pending and not _lost(pending[0][1]) \
+                    and pending[0][1].is_published():
+                pending.popleft()
+            if not self.ip.client.is_connected() or (pending and (
+                    _lost(pending[0][1])
+                    or now - pending[0][0] > self._latency)):
+                self._fail_ip()
+            return
+        if now < self._probe_at:
+            return
+        self._probe_at = now + self._probe_interval
+        # The client reconnects by itself once the connection is made. A
+        # stalled broker keeps the connection, so the messages sent before
+        # the failover must be acknowledged as well.
+        if self.ip is not None and self.ip.client.is_connected() and \
+                all(_lost(info) or info.is_published()
+                    for info in self.ip._outstanding):
+            self._ip_ok = True
+            self.failbacks += 1
+
+    def _next(self) -> tuple | None:
+        """Take the next message for the current link"""
+        if self._ip_ok:
+            return self._queue.popleft() if self._queue else None
+        if self.nbiot is None or time.monotonic() < self._nbiot_retry_at:
+            return None
+        for idx, entry in enumerate(self._queue):
+            if entry[1] >= self._failover_qos:
+                del self._queue[idx]
+                return entry
+        return None
+
+    def _send(self, entry: tuple):
+        if self._ip_ok:
+            try:
+                info = self.ip.send_topics(*entry)
+            except (IOError, queue.Full):
+                with self._cond:
+                    self._queue.appendleft(entry)
+                    self._fail_ip()
+                return
+            with self._cond:
+                self._pending.append((time.monotonic(), info, entry))
+                self.sent["IP"] += 1
+            return
+        try:
+            self.nbiot.send_topics(*entry)
+        except IOError:
+            with self._cond:
+                self._queue.appendleft(entry)
+                self.failures += 1
+                self._nbiot_retry_at = time.monotonic() + self._retry
+            return
+        except ValueError:
+            # Too large for the modem buffer
+            with self._cond:
+                self.dropped += 1
+            return
+        with self._cond:
+            self.sent["NBIoT"] += 1
+
+    def _reconnect(self):
+        """Connect the links which failed to connect, outside of the lock,
+        as it can take long"""
+        if self._ip_ok:
+            return
+        now = time.monotonic()
+        if self.ip is None and now >= self._probe_at:
+            self._connect_ip()
+        if self.nbiot is None and now >= self._nbiot_retry_at:
+            self._nbiot_retry_at = now + self._retry
+            self._connect_nbiot()
+
+    def _run(self):
+        tick = min(self._latency, self._probe_interval) / 4
+        while True:
+            self._reconnect()
+            with self._cond:
+                if self._stop:
+                    return
+                self._check_ip()
+                entry = self._next()
+                if entry is None:
+                    self._cond.notify_all()
+                    self._cond.wait(tick)
+                    continue
+                self._sending = 1
+            self._send(entry)
+            with self._cond:
+                self._sending = 0
+                self._cond.notify_all()
+
+
+class SensorSampler:
+    """Sample sensors at individual rates on a background thread.
+
+    Each sensor is read into a bounded ring buffer, where the oldest samples
+    are overwritten when it is full. Draining never waits for the sensors,
+    so a slow publish does not delay or drop the sampling.
+    """
+    def __init__(self,
+                 sensors: dict[str, Callable],
+                 rates: dict[str, float],
+                 capacity: int = 3600,
+                 channels: dict[str, tuple[str, ...]] | None = None):
+        """
+        Parameters
+        -----
+        sensors : dict[str, Callable]
+            Sensor name and a callable returning (value, timestamp).
+        rates : dict[str, float]
+            Sample rate in Hz, for each sensor name to sample.
+        capacity : int
+            Number of samples kept for each sensor.
+        channels : dict[str, tuple[str, ...]] | None
+            Identifiers of the values, for sensors returning a list of
+            values, e.g. {"gas": ("tvoc", "eco2")}.
+        """
+        for name, rate in rates.items():
+            if name not in sensors:
+                raise ValueError(f"Unknown sensor {name}, must be in: "\
+                                 f"{list(sensors)}")
+            if rate <= 0:
+                raise ValueError(f"Rate for {name} must be positive")
+        self._sensors = {name: sensors[name] for name in rates}
+        self._channels = {name: idents for name, idents
+                          in (channels or {}).items() if name in rates}
+        self._periods = {name: 1 / rate for name, rate in rates.items()}
+        self._buffers = {name: deque(maxlen=capacity) for name in rates}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.dropped = dict.fromkeys(rates, 0)
+        """Samples overwritten in a full buffer, by sensor"""
+        self.overruns = dict.fromkeys(rates, 0)
+        """Sample slots skipped because reads fell behind, by sensor"""
+        self.errors = dict.fromkeys(rates, 0)
+        """Failed sensor reads, by sensor"""
+
+    @property
+    def running(self) -> bool:
+        """True while the sampling thread is active"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling on a background thread"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="aauiot-sampler",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """Stop sampling, buffered samples can still be drained"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        now = time.monotonic()
+        schedule = [(now, name) for name in self._sensors]
+        heapq.heapify(schedule)
+        while not self._stop.is_set():
+            due, name = schedule[0]
+            delay = due - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            try:
+                sample = self._sensors[name]()
+            except Exception:
+                # A failing sensor must not stop sampling the others
+                self.errors[name] += 1
+            else:
+                with self._lock:
+                    buf = self._buffers[name]
+                    if len(buf) == buf.maxlen:
+                        self.dropped[name] += 1
+                    buf.append(sample)
+
+            # Fixed rate schedule, skip slots which are already missed.
+            period = self._periods[name]
+            due += period
+            behind = time.monotonic() - due
+            if behind > 0:
+                missed = math.ceil(behind / period)
+                self.overruns[name] += missed
+                due += missed * period
+            heapq.heapreplace(schedule, (due, name))
+
+    def available(self, name: str) -> int:
+        """Number of buffered samples for a sensor"""
+        return len(self._buffers[name])
+
+    def drain(self,
+              name: str,
+              max_items: int | None = None) -> list[tuple[object, str]]:
+        """Remove and return buffered samples, oldest first.
+
+        Parameters
+        -----
+        name : str
+            Sensor name
+        max_items : int | None
+            Maximum number of samples to return, None for all.
+
+        Returns
+        -----
+        list[tuple[object, str]] : [(value, timestamp), ...]
+        """
+        buf = self._buffers[name]
+        with self._lock:
+            count = len(buf) if max_items is None else min(max_items, len(buf))
+            return [buf.popleft() for _ in range(count)]
+
+    def drain_data(self,
+                   name: str,
+                   identifier: str | None = None,
+                   bufsize: int = 512) -> MqttData | MqttMultiData | None:
+        """Remove buffered samples into a MqttData object of at most bufsize.
+
+        Samples which do not fit are kept for the next call, a first
+        sample larger than bufsize is returned alone. Sensors with
+        channels return a MqttMultiData instead, with a MqttData for each
+        value identified by the channel names.
+
+        Parameters
+        -----
+        name : str
+            Sensor name
+        identifier : str | None
+            MqttData identifier, defaults to the sensor name. Not used for
+            sensors with channels.
+        bufsize : int
+            MqttData buffer size
+
+        Returns
+        -----
+        MqttData | MqttMultiData | None : None if no samples are buffered.
+        """
+        if name in self._channels:
+            return self._drain_channels(name, bufsize)
+        buf = self._buffers[name]
+        data = MqttData(identifier or name, bufsize=bufsize)
+        with self._lock:
+            while len(buf) > 0:
+                val, ts = buf[0]
+                if data.add_measurement(val, ts) < 0 and len(data.vals) > 1:
+                    data.pop()
+                    break
+                buf.popleft()
+        if len(data.vals) == 0:
+            return None
+        return data
+
+    def _drain_channels(self, name: str, bufsize: int) -> MqttMultiData | None:
+        buf = self._buffers[name]
+        blocks = [MqttData(ident, bufsize=bufsize)
+                  for ident in self._channels[name]]
+        count = 0
+        with self._lock:
+            while len(buf) > 0:
+                vals, ts = buf[0]
+                if len(vals) != len(blocks):
+                    raise ValueError(f"{name} returned {len(vals)} values, "\
+                                     f"expected {len(blocks)}")
+                for block, val in zip(blocks, vals):
+                    block.add_measurement(val, ts)
+                # See MqttMultiData.__len__
+                if sum(len(block) for block in blocks) + len(blocks) - 1 \
+                        > bufsize and count > 0:
+                    for block in blocks:
+                        block.pop()
+                    break
+                buf.popleft()
+                count += 1
+        if count == 0:
+            return None
+        return MqttMultiData(blocks, bufsize)
+
+
+class _hardware_backend:
+    """Sensor drivers on the I2C bus of the Pi"""
+    @staticmethod
+    def bme680() -> BME680:
+        from adafruit_bme680 import Adafruit_BME680_I2C
+        bme = Adafruit_BME680_I2C(_i2c(), refresh_rate=100)
+        bme.set_gas_heater(None, None)
+        return bme
+
+    @staticmethod
+    def veml7700() -> VEML7700:
+        from adafruit_veml7700 import VEML7700
+        return VEML7700(_i2c())
+
+    @staticmethod
+    def sgp30() -> SGP30:
+        from adafruit_sgp30 import Adafruit_SGP30
+        return Adafruit_SGP30(_i2c())
 
 
 class aau_iot:
     """AAU IoT, board support crate"""
-    def __init__(self, server="172.20.0.22", userid="group"):
-        bme = BME680(i2c, refresh_rate=100)
-        bme.set_gas_heater(None, None)
-        veml7700 = VEML7700(i2c)
-        sgp30 = SGP30(i2c)
+    def __init__(self, server="172.20.0.22", userid="group", backend=None):
+        """
+        Parameters
+        -----
+        server : str
+            MQTT server IP
+        userid : str
+            Group id
+        backend : SimulatedBackend | ReplayBackend | None
+            Source of the sensor drivers, None for the sensors on the Pi.
+        """
+        if backend is None:
+            backend = _hardware_backend()
+        # Sensors are initialized on first access
+        bme = _lazy(backend.bme680)
+        veml7700 = _lazy(backend.veml7700)
+        sgp30 = _lazy(backend.sgp30)
 
         self.humidity = _humidity(bme)
         self.temperature = _temperature(bme)
         self.pressure = _pressure(bme)
+        self.environment = _environment(bme)
         self.light = _light(veml7700)
         self.gas = _gas(sgp30)
         self.mqtt = None
+        self.sampler = None
         self._ip = server
         self._uid = userid
 
     def _fetch_file(self, server, port):
+        import requests
         res = requests.get(
             f"http://{server}:{port}/{self._uid}.csv", timeout=5
             )
@@ -395,16 +2411,67 @@ class aau_iot:
         with open(f"{self._uid}.csv", "w") as f:
             f.write(res.text)
 
-    _mqtt_mode = Literal["IP", "NBIoT"]
+    def start_sampling(self,
+                       rates: dict[str, float],
+                       capacity: int = 3600) -> SensorSampler:
+        """Sample sensors at individual rates on a background thread.
+
+        Parameters
+        -----
+        rates : dict[str, float]
+            Sample rate in Hz by sensor name, "humidity", "temperature",
+            "pressure", "environment", "light" or "gas". "environment" and
+            "gas" are drained into a MqttMultiData, identified by
+            "temperature", "humidity", "pressure" and "tvoc", "eco2".
+        capacity : int
+            Number of samples buffered for each sensor.
+
+        Returns
+        -----
+        SensorSampler : Also available as aau_iot.sampler
+        """
+        self.stop_sampling()
+        sensors = {
+            "humidity": self.humidity,
+            "temperature": self.temperature,
+            "pressure": self.pressure,
+            "environment": self.environment,
+            "light": self.light,
+            "gas": self.gas,
+        }
+        self.sampler = SensorSampler(sensors, rates, capacity,
+                                     _SENSOR_CHANNELS)
+        self.sampler.start()
+        return self.sampler
+
+    def stop_sampling(self):
+        """Stop background sampling"""
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    _mqtt_mode = Literal["IP", "NBIoT", "auto"]
     def mqtt_connect(self,
                      mode: _mqtt_mode = "IP",
                      port: int = 1883,
-                     topic: str = "aauiot/"):
-        """Setup MQTT Connection over IP or NB-IoT"""
+                     topic: str = "aauiot/",
+                     device: str = "/dev/ttyAMA0",
+                     resume: bool = False):
+        """Setup MQTT Connection over IP or NB-IoT
+
+        device is the modem serial port for NB-IoT, e.g.
+        Sim7020Emulator.device to run without the HAT. resume reuses the
+        NB-IoT session of a previous run, see messaging_nbiot. "auto"
+        connects both, and sends over IP with NB-IoT as the fallback, see
+        messaging_auto.
+        """
         if mode == "IP":
             self.mqtt = messaging_ip(self._ip, port, topic, self._uid)
         elif mode == "NBIoT":
-            self.mqtt = messaging_nbiot(self._ip, port, topic, self._uid)
+            self.mqtt = messaging_nbiot(self._ip, port, topic, self._uid,
+                                        device=device, resume=resume)
+        elif mode == "auto":
+            self.mqtt = messaging_auto(self._ip, port, topic, self._uid,
+                                       device=device, resume=resume)
         else:
             raise ValueError(
                 f"Invalid mode: must be in: {aau_iot._mqtt_mode.__args__}")
@@ -428,7 +2495,8 @@ class aau_iot:
 
     @staticmethod
     def get_time():
-        """Return current time in HH:MM:SS"""
+        """Return current time in HH:MM:SS, or as set by
+        set_timestamp_provider"""
         return _get_time()
 
 
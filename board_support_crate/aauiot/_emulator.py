@@ -0,0 +1,320 @@
+#%%
+"""Emulated SIM7020 modem on a pseudo terminal, for running the NB-IoT path
+without the HAT.
+
+The emulator answers the AT commands used by Sim7020x on the master side of
+a pty, and Sim7020x opens the slave side like the real serial port::
+
+    with Sim7020Emulator(broker=("localhost", 1883)) as modem:
+        mqtt = messaging_nbiot(SERVER, device=modem.device)
+
+Command latency, attach time and errors are configurable, so runs are
+repeatable. Published messages can be forwarded to a MQTT broker.
+"""
+from __future__ import annotations
+import os
+import re
+import random
+import select
+import threading
+import time
+from collections import deque
+
+_CMQPUB = re.compile(
+    r'AT\+CMQPUB=(\d+),"([^"]*)",(\d),(\d),(\d),(\d+),"(.*)"$')
+_CMQNEW = re.compile(r'AT\+CMQNEW="([^"]*)","(\d+)",(\d+),(\d+)$')
+_CMQCON = re.compile(r'AT\+CMQCON=(\d+),(\d),"([^"]*)",(\d+),(\d),(\d)')
+
+
+class Sim7020Emulator:
+    """Scripted SIM7020 responder on a pty
+
+    Implements CFUN, COPS, CSQ, CGREG, CEREG, CGCONTRDP, *MCGDEFCONT,
+    CREVHEX, CMQNEW, CMQCON, CMQDISCON and CMQPUB. Other commands reply
+    ERROR. Commands are echoed, like the modem does by default.
+    """
+    def __init__(self,
+                 latency: float = 0.002,
+                 publish_latency: float = 0.0,
+                 attach_time: float = 0.5,
+                 error_rate: float = 0.0,
+                 broker: tuple[str, int] | None = None,
+                 seed: int | None = None):
+        """
+        Parameters
+        -----
+        latency : float
+            Seconds from receiving a command to the reply.
+        publish_latency : float
+            Additional seconds for AT+CMQPUB, the uplink time.
+        attach_time : float
+            Seconds from AT+CFUN=1 until the PDP context is up.
+        error_rate : float
+            Probability of replying ERROR to any command.
+        broker : tuple[str, int] | None
+            Host and port of a MQTT broker, published messages are
+            forwarded to. None to only record them.
+        seed : int | None
+            Seed of the error injection.
+        """
+        self.latency = latency
+        self.publish_latency = publish_latency
+        self.attach_time = attach_time
+        self.error_rate = error_rate
+        self._broker = broker
+        self._random = random.Random(seed)
+        self._failures: deque[tuple[str, bytes]] = deque()
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._client = None
+        self.commands: deque[str] = deque(maxlen=1000)
+        """Last received commands"""
+        self.published: deque[tuple[str, bytes, int]] = deque(maxlen=1000)
+        """Last published messages, as topic, payload and QoS"""
+        self.publish_count = 0
+        self.publish_bytes = 0
+        self._reset()
+
+    def _reset(self):
+        self.rf = False
+        self.cops = "23802"
+        self.apn = ""
+        self.cereg = 0
+        self.hex = False
+        self._attached_at = None
+        self._mqtt_server = None
+        self._mqtt_buffer = 0
+        self._mqtt_connected = False
+
+    # ----- Control -----
+
+    def start(self) -> str:
+        """Open the pty and start answering, returns the device path"""
+        self._master, self._slave = os.openpty()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self.device
+
+    def stop(self):
+        """Stop answering and close the pty"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._forward_stop()
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def device(self) -> str:
+        """Path of the serial device, for Sim7020x"""
+        return os.ttyname(self._slave)
+
+    def fail_next(self, command: str, count: int = 1,
+                  reply: bytes = b"ERROR"):
+        """Reply with an error to the next count commands starting with
+        command, e.g. "AT+CMQPUB" """
+        for _ in range(count):
+            self._failures.append((command, reply))
+
+    def send_urc(self, urc: str):
+        """Send a unsolicited result code, e.g. "+CEREG: 1" """
+        with self._write_lock:
+            os.write(self._master, b"\r\n" + urc.encode() + b"\r\n")
+
+    def drop_link(self):
+        """Lose coverage, the PDP context and the MQTT session are lost"""
+        self._attached_at = None
+        self._mqtt_connected = False
+        if self.cereg:
+            self.send_urc("+CEREG: 2")
+
+    def restore_link(self):
+        """Regain coverage, attaching after attach_time"""
+        if self.rf:
+            self._attach()
+
+    @property
+    def attached(self) -> bool:
+        return self._attached_at is not None \
+            and time.monotonic() >= self._attached_at
+
+    def _attach(self):
+        self._attached_at = time.monotonic() + self.attach_time
+        if self.cereg:
+            timer = threading.Timer(self.attach_time, self._attach_urc)
+            timer.daemon = True
+            timer.start()
+
+    def _attach_urc(self):
+        if self.attached and self._master is not None:
+            self.send_urc("+CEREG: 1")
+
+    # ----- Responder -----
+
+    def _run(self):
+        buf = b""
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                buf += os.read(self._master, 4096)
+            except OSError:
+                return
+            # Commands end with CR, Sim7020x sends CRLF
+            while b"\r" in buf:
+                line, buf = buf.split(b"\r", 1)
+                cmd = line.strip(b"\n").decode(errors="replace")
+                if cmd:
+                    self._answer(cmd)
+
+    def _answer(self, cmd: str):
+        self.commands.append(cmd)
+        time.sleep(self.latency)
+        reply = self._injected_error(cmd)
+        if reply is None:
+            try:
+                reply = self._handle(cmd)
+            except (ValueError, IndexError):
+                reply = b"ERROR"
+        with self._write_lock:
+            os.write(self._master, cmd.encode() + b"\r\r\n" + reply + b"\r\n")
+
+    def _injected_error(self, cmd: str) -> bytes | None:
+        if self._failures and cmd.startswith(self._failures[0][0]):
+            return self._failures.popleft()[1]
+        if self.error_rate and self._random.random() < self.error_rate:
+            return b"ERROR"
+        return None
+
+    def _handle(self, cmd: str) -> bytes:
+        """Reply to a command, without the trailing CRLF"""
+        if cmd == "AT":
+            return b"OK"
+        if cmd.startswith("AT+CFUN="):
+            self.rf = cmd[-1] == "1"
+            if self.rf:
+                self._attach()
+            else:
+                self._attached_at = None
+                self._mqtt_connected = False
+                self._mqtt_server = None
+            return b"OK"
+        if cmd.startswith("AT+COPS="):
+            if cmd != "AT+COPS=0":
+                self.cops = cmd.split(",")[2].strip('"')
+            return b"OK"
+        if cmd == "AT+COPS?":
+            return f'+COPS: 1,2,"{self.cops}",9\r\n\r\nOK'.encode()
+        if cmd == "AT+CSQ":
+            rssi = 20 if self.attached else 99
+            return f"+CSQ: {rssi},0\r\n\r\nOK".encode()
+        if cmd == "AT+CGREG?":
+            return f"+CGREG: 0,{int(self.attached)}\r\n\r\nOK".encode()
+        if cmd.startswith("AT+CEREG="):
+            self.cereg = int(cmd.split("=")[1])
+            return b"OK"
+        if cmd == "AT+CEREG?":
+            return f"+CEREG: {self.cereg},{int(self.attached)}\r\n\r\nOK"\
+                .encode()
+        if cmd == "AT+CGCONTRDP":
+            if not self.attached:
+                return b"OK"
+            return f'+CGCONTRDP: 1,5,"{self.apn}",'\
+                   f'"10.0.0.2.255.255.255.0"\r\n\r\nOK'.encode()
+        if cmd.startswith("AT*MCGDEFCONT="):
+            self.apn = cmd.split(",")[1].strip('"')
+            return b"OK"
+        if cmd.startswith("AT+CREVHEX="):
+            self.hex = cmd[-1] == "1"
+            return b"OK"
+        if cmd.startswith("AT+CMQ"):
+            return self._handle_mqtt(cmd)
+        return b"ERROR"
+
+    def _handle_mqtt(self, cmd: str) -> bytes:
+        if cmd == "AT+CMQNEW?":
+            server = "null" if self._mqtt_server is None \
+                else f'"{self._mqtt_server[0]}"'
+            used = int(self._mqtt_server is not None)
+            return f"+CMQNEW: 0,{used},{server}\r\n\r\nOK".encode()
+        if cmd == "AT+CMQCON?":
+            if self._mqtt_server is None:
+                return b"OK"
+            state = int(self._mqtt_connected)
+            return f'+CMQCON: 0,{state},"{self._mqtt_server[0]}"\r\n\r\nOK'\
+                .encode()
+        match = _CMQNEW.match(cmd)
+        if match:
+            if not self.attached or self._mqtt_server is not None:
+                return b"ERROR"
+            self._mqtt_server = (match[1], int(match[2]))
+            self._mqtt_buffer = int(match[4])
+            return b"+CMQNEW: 0\r\n\r\nOK"
+        match = _CMQCON.match(cmd)
+        if match:
+            if not self.attached or self._mqtt_server is None:
+                return b"ERROR"
+            self._mqtt_connected = True
+            self._forward_start(match[3])
+            return b"OK"
+        if cmd.startswith("AT+CMQDISCON="):
+            self._mqtt_connected = False
+            self._mqtt_server = None
+            self._forward_stop()
+            return b"OK"
+        match = _CMQPUB.match(cmd)
+        if match:
+            return self._publish(match)
+        return b"ERROR"
+
+    def _publish(self, match: re.Match) -> bytes:
+        if not (self.attached and self._mqtt_connected):
+            return b"ERROR"
+        topic, qos, length, message = \
+            match[2], int(match[3]), int(match[6]), match[7]
+        if length != len(message) or length > self._mqtt_buffer:
+            return b"ERROR"
+        if self.hex:
+            payload = bytes.fromhex(message)
+        else:
+            payload = message.encode()
+        time.sleep(self.publish_latency)
+        self.publish_count += 1
+        self.publish_bytes += len(payload)
+        self.published.append((topic, payload, qos))
+        if self._client is not None:
+            self._client.publish(topic, payload, qos)
+        return b"OK"
+
+    # ----- Broker forwarding -----
+
+    def _forward_start(self, client_id: str):
+        if self._broker is None or self._client is not None:
+            return
+        import paho.mqtt.client as mqtt
+        client = mqtt.Client(client_id=client_id)
+        client.connect(*self._broker)
+        client.loop_start()
+        self._client = client
+
+    def _forward_stop(self):
+        if self._client is None:
+            return
+        self._client.disconnect()
+        self._client.loop_stop()
+        self._client = None
@@ -0,0 +1,288 @@
+#%%
+"""Disk backed store and forward outbox, for riding out lost coverage.
+
+Samples are written to a SQLite file before they are published, and only
+removed once the transport has accepted them. The backlog is read a
+message at a time, so memory use does not grow with the backlog.
+"""
+from __future__ import annotations
+import queue
+import threading
+import time
+from ._core import MqttData, MqttMultiData, _messaging
+
+# single_ts marks samples of a message sent with only its first timestamp
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    identifier TEXT NOT NULL,
+    qos INTEGER NOT NULL,
+    value REAL NOT NULL,
+    ts TEXT NOT NULL,
+    single_ts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_identifier ON outbox (identifier, qos, id);
+"""
+
+
+class Outbox:
+    """Persistent outbox in front of a transport
+
+    ``send_topics`` stores the samples and tries to send the backlog. When
+    the transport raises IOError, the samples are kept and retried after
+    ``retry`` seconds, or by the drain loop started with ``start``. The
+    backlog is sent oldest first, packed into messages which fill the
+    transport buffer.
+
+    Disk usage is bounded by ``max_bytes``, above which the oldest samples
+    are evicted. The SQLite file keeps its size once grown, freed pages are
+    reused.
+
+    Can be used in place of the transport for MqttBatcher. The blocks of a
+    MqttMultiData are stored, and sent, per identifier. Samples must be
+    numbers.
+    """
+    def __init__(self,
+                 mqtt: _messaging,
+                 path: str = "aauiot_outbox.db",
+                 max_bytes: int = 16 * 2**20,
+                 retry: float = 30,
+                 bufsize: int | None = None):
+        """
+        Parameters
+        -----
+        mqtt : messaging_ip | messaging_nbiot
+            Transport used to send the messages.
+        path : str
+            SQLite file, an existing backlog is sent after a restart.
+        max_bytes : int
+            Maximum size of the stored samples in bytes.
+        retry : float
+            Seconds to wait after a failed publish, before trying again.
+        bufsize : int | None
+            Message limit in bytes, defaults to the transport max_payload.
+        """
+        self._mqtt = mqtt
+        self._uid = mqtt._uid
+        self._max_bytes = max_bytes
+        self._retry = retry
+        self._bufsize = bufsize
+        import sqlite3
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._page_size = self._pragma("page_size")
+        self._lock = threading.Lock()
+        """Serializes access to the database"""
+        self._drain_lock = threading.Lock()
+        """Only one drain at a time, so samples are sent once"""
+        self._count = self._db.execute(
+            "SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self._retry_at = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.evicted = 0
+        """Samples removed to stay below max_bytes"""
+        self.dropped = 0
+        """Samples rejected by the transport, e.g. too large"""
+        self.failures = 0
+        """Publishes which raised IOError or queue.Full"""
+
+    def __len__(self):
+        """Number of samples in the backlog"""
+        return self._count
+
+    @property
+    def max_payload(self) -> int:
+        return self._mqtt.max_payload
+
+    def _pragma(self, name: str) -> int:
+        return self._db.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def _limit(self) -> int:
+        bufsize = self._bufsize
+        if bufsize is None:
+            bufsize = self._mqtt.max_payload
+        # send_topics prefixes the payload with "<userid>,"
+        return bufsize - len(self._uid) - 1
+
+    def disk_usage(self) -> int:
+        """Bytes of the database in use, excluding free pages"""
+        with self._lock:
+            pages = self._pragma("page_count") - self._pragma("freelist_count")
+        return pages * self._page_size
+
+    def send_topics(self,
+                    data: MqttData | MqttMultiData,
+                    qos: int = 0) -> None:
+        """Store the samples of data, and send the backlog if possible
+
+        The backlog is sent by the drain loop instead, when it is running.
+
+        Raises
+        -----
+        ValueError
+            If a sample is not a number.
+        """
+        blocks = data.data if isinstance(data, MqttMultiData) else [data]
+        rows = []
+        for block in blocks:
+            ts = block.ts
+            single_ts = len(ts) == 1 and len(block.vals) > 1
+            if single_ts:
+                ts = ts * len(block.vals)
+            for val, t in zip(block.vals, ts):
+                if isinstance(val, bool) or \
+                        not isinstance(val, (int, float)):
+                    raise ValueError(f"{block.identifier} sample {val!r} "\
+                                     "is not a number")
+                rows.append((block.identifier, qos, val, t, single_ts))
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO outbox (identifier, qos, value, ts, single_ts) "\
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            self._count += len(rows)
+            self._evict()
+            self._db.commit()
+
+        if self._thread is not None:
+            self._wake.set()
+        else:
+            self.drain()
+
+    def _evict(self):
+        """Remove the oldest samples until below max_bytes"""
+        while self._count > 0:
+            pages = self._pragma("page_count") - self._pragma("freelist_count")
+            if pages * self._page_size <= self._max_bytes:
+                return
+            # Evict a tenth at a time, pages are only freed when emptied.
+            chunk = max(self._count // 10, 1)
+            cur = self._db.execute(
+                "DELETE FROM outbox WHERE id IN "\
+                "(SELECT id FROM outbox ORDER BY id LIMIT ?)", (chunk,))
+            self._count -= cur.rowcount
+            self.evicted += cur.rowcount
+
+    def _next_message(self) -> tuple[MqttData, int, list[int]] | None:
+        """Pack the oldest samples of one identifier into a message
+
+        Samples stored with single_ts are packed with the first timestamp
+        only, as long as they share it.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT identifier, qos, single_ts, ts FROM outbox "\
+                "ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            identifier, qos, single_ts, first_ts = row
+            if single_ts:
+                data = MqttData(identifier, timestamps=first_ts,
+                                bufsize=self._limit())
+            else:
+                data = MqttData(identifier, bufsize=self._limit())
+            ids = []
+            cur = self._db.execute(
+                "SELECT id, value, ts FROM outbox WHERE identifier = ? "\
+                "AND qos = ? AND single_ts = ? ORDER BY id",
+                (identifier, qos, single_ts))
+            for row_id, val, ts in cur:
+                if single_ts:
+                    if ts != first_ts:
+                        break
+                    remainder = data.add_measurement(val)
+                else:
+                    remainder = data.add_measurement(val, ts)
+                if remainder < 0 and len(ids) > 0:
+                    data.pop()
+                    break
+                ids.append(row_id)
+                if remainder <= 0:
+                    break
+            cur.close()
+        return data, qos, ids
+
+    def _remove(self, ids: list[int]):
+        with self._lock:
+            cur = self._db.executemany("DELETE FROM outbox WHERE id = ?",
+                                       ((row_id,) for row_id in ids))
+            self._count -= cur.rowcount
+            self._db.commit()
+
+    def drain(self, force: bool = False) -> int:
+        """Send the backlog, until it is empty or a publish fails
+
+        Parameters
+        -----
+        force : bool
+            Try now, even within the retry delay of a failed publish.
+
+        Returns
+        -----
+        int : Number of samples sent
+        """
+        if not force and time.monotonic() < self._retry_at:
+            return 0
+        sent = 0
+        with self._drain_lock:
+            while True:
+                message = self._next_message()
+                if message is None:
+                    break
+                data, qos, ids = message
+                try:
+                    self._mqtt.send_topics(data, qos)
+                except ValueError:
+                    self.dropped += len(ids)
+                except (IOError, queue.Full):
+                    self.failures += 1
+                    self._retry_at = time.monotonic() + self._retry
+                    break
+                else:
+                    sent += len(ids)
+                self._remove(ids)
+        return sent
+
+    def start(self, interval: float = 5):
+        """Drain the backlog on a background thread
+
+        Parameters
+        -----
+        interval : float
+            Seconds between checking for a backlog, new samples wake the
+            thread immediately.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the drain loop"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, interval: float):
+        while not self._stop.is_set():
+            timeout = interval
+            if self._count > 0:
+                # Retry as soon as the delay after a failure has passed
+                timeout = min(interval,
+                              max(self._retry_at - time.monotonic(), 0))
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if self._count > 0:
+                self.drain()
+
+    def close(self):
+        """Stop the drain loop and close the database, the backlog is
+        kept for the next run"""
+        self.stop()
+        self._db.close()
@@ -1,30 +1,293 @@
 #%%
+import os
 import time
-from typing import Literal
+import math
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Literal
 import serial
 
+logger = logging.getLogger(__name__)
+
+# Registration status URCs, enabled with AT+CEREG=1
+_REG_URCS = ("+CEREG:", "+CGREG:")
+
+class AtStats:
+    """Counters and latency histograms per AT command
+
+    Latency is from writing the command until the final result code, or the
+    timeout. Wait is the time spent in the cmd_delay throttle before it.
+    """
+    BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, math.inf)
+    """Upper bounds of the latency histogram in s"""
+
+    def __init__(self, log_interval: float | None = None):
+        """
+        Parameters
+        -----
+        log_interval : float | None
+            Seconds between logging a summary line at INFO level, None to
+            never log.
+        """
+        self.log_interval = log_interval
+        self._lock = threading.Lock()
+        self._last_log = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._commands: dict[str, dict] = {}
+            self.bytes_written = 0
+            self.bytes_read = 0
+            self.retries = 0
+            """Repeated polls, while waiting for the network or session"""
+
+    @staticmethod
+    def _name(at_cmd: str) -> str:
+        """Command without its arguments, e.g. AT+CMQPUB or AT+CMQNEW?"""
+        return at_cmd.split("=", 1)[0]
+
+    def record(self,
+               at_cmd: str,
+               wait: float,
+               latency: float,
+               written: int,
+               read: int,
+               success: bool,
+               timed_out: bool):
+        with self._lock:
+            stats = self._commands.get(self._name(at_cmd))
+            if stats is None:
+                stats = {"count": 0, "errors": 0, "timeouts": 0,
+                         "wait_s": 0.0, "latency_s": 0.0, "max_s": 0.0,
+                         "histogram": [0] * len(self.BUCKETS)}
+                self._commands[self._name(at_cmd)] = stats
+            stats["count"] += 1
+            stats["errors"] += not success and not timed_out
+            stats["timeouts"] += timed_out
+            stats["wait_s"] += wait
+            stats["latency_s"] += latency
+            stats["max_s"] = max(stats["max_s"], latency)
+            for idx, bound in enumerate(self.BUCKETS):
+                if latency <= bound:
+                    stats["histogram"][idx] += 1
+                    break
+            self.bytes_written += written
+            self.bytes_read += read
+
+        if self.log_interval is not None \
+                and time.monotonic() - self._last_log >= self.log_interval:
+            self._last_log = time.monotonic()
+            logger.info(self.summary())
+
+    def _quantile(self, histogram: list[int], count: int, q: float) -> float:
+        """Upper bucket bound of the q quantile"""
+        target = q * count
+        total = 0
+        for bound, n in zip(self.BUCKETS, histogram):
+            total += n
+            if total >= target:
+                return bound
+        return math.inf
+
+    def snapshot(self) -> dict:
+        """Copy of the counters
+
+        Returns
+        -----
+        dict : "commands" maps each command to count, errors, timeouts,
+            wait_s, latency_s, max_s, p50_s, p99_s and histogram, next to
+            the totals bytes_written, bytes_read, timeouts and retries.
+        """
+        with self._lock:
+            commands = {}
+            for name, stats in self._commands.items():
+                stats = dict(stats, histogram=list(stats["histogram"]))
+                stats["p50_s"] = self._quantile(stats["histogram"],
+                                                stats["count"], 0.5)
+                stats["p99_s"] = self._quantile(stats["histogram"],
+                                                stats["count"], 0.99)
+                commands[name] = stats
+            return {
+                "commands": commands,
+                "bytes_written": self.bytes_written,
+                "bytes_read": self.bytes_read,
+                "timeouts": sum(c["timeouts"] for c in commands.values()),
+                "retries": self.retries,
+            }
+
+    def summary(self) -> str:
+        """One line summary of the snapshot"""
+        snap = self.snapshot()
+        parts = [f"{name} n={c['count']} err={c['errors']} "\
+                 f"to={c['timeouts']} p50<={c['p50_s']}s "\
+                 f"wait={c['wait_s']:.2f}s busy={c['latency_s']:.2f}s"
+                 for name, c in snap["commands"].items()]
+        return f"AT tx={snap['bytes_written']}B rx={snap['bytes_read']}B "\
+               f"retries={snap['retries']}; " + "; ".join(parts)
+
+
+def _command_prefix(at_cmd: str) -> str:
+    """Prefix of the information lines of a command, e.g. +CSQ for AT+CSQ"""
+    name = at_cmd[2:]
+    for sep in "=?":
+        name = name.split(sep, 1)[0]
+    return name
+
+def _split_fields(value: str) -> list[int | str]:
+    """Split "0,1,\"a,b\"" into [0, 1, "a,b"]"""
+    fields = []
+    quoted = None
+    for part in value.split(","):
+        if quoted is not None:
+            # Comma inside a quoted field
+            quoted += "," + part
+            if part.endswith('"'):
+                fields.append(quoted[1:-1])
+                quoted = None
+        elif part[:1] == '"':
+            if len(part) > 1 and part[-1] == '"':
+                fields.append(part[1:-1])
+            else:
+                quoted = part
+        elif part.lstrip("-").isdigit():
+            fields.append(int(part))
+        else:
+            fields.append(part)
+    return fields
+
 class AtMsg:
-    """Data class to keep track of entries in AT return statements"""
-    def __init__(self, msg: bytes | str):
-        if isinstance(msg, bytes):
-            msg = msg.decode()
-        self.echo = ""
+    """Data class to keep track of entries in AT return statements
+
+    The reply is parsed in one pass over the raw bytes into:
+
+    - echo: The echoed command.
+    - response: Information lines, None if there are none.
+    - info: Information values keyed by prefix, e.g. "+CMQNEW" for
+      "+CMQNEW: 0,1,host". Lines without a prefix are kept under "".
+    - urcs: Lines with the prefix of another command, received while the
+      command was running.
+    - result: The final result code, success is True if it is OK.
+    """
+    __slots__ = ("_echo", "success", "result", "response", "info", "urcs")
+
+    def __init__(self,
+                 msg: bytes | bytearray | memoryview | str,
+                 end: int | None = None):
+        """
+        Parameters
+        -----
+        msg : bytes | bytearray | memoryview | str
+            Reply from the modem.
+        end : int | None
+            Only parse msg[:end], without copying the rest.
+        """
+        if isinstance(msg, str):
+            msg = msg.encode()
+        elif isinstance(msg, memoryview):
+            msg = msg.tobytes()
+        if end is None:
+            end = len(msg)
         self.success = ""
+        self.result = ""
         self.response = None
-        self._split_msg(msg)
-
-    def _split_msg(self, msg):
-        """Split AT command into Echo, msg and success parts."""
-        if '\r\r\n' in msg:
-            self.echo, msg = msg.split("\r\r\n")
-        if "\r\n\r\n" in msg:
-            tmp = msg.split("\r\n\r\n")
-            if len(tmp) > 1:
-                self.response = tmp[:-1]
-            msg = tmp[-1]
-        if "\r\n" in msg:
-            success = msg.split("\r\n")[0]
-            self.success = True if success == "OK" else False
+        self.info: dict[str, list[str]] = {}
+        self.urcs: list[str] = []
+
+        start = msg.find(b"\r\r\n", 0, end)
+        if start >= 0:
+            # Kept as bytes, a AT+CMQPUB echo holds the whole message.
+            self._echo = msg[:start]
+            start += 3
+        else:
+            self._echo = b""
+            start = 0
+        rest = msg[start:end]
+        if rest == b"OK\r\n":
+            self.result = "OK"
+            self.success = True
+        elif not (rest.endswith(b"\r\n\r\nOK\r\n")
+                  and self._query_reply(rest[:-8])):
+            self._split_msg(rest.decode(errors="replace"))
+
+    def _query_reply(self, line: bytes) -> bool:
+        """Fast path for one information line of the command, as replied
+        to queries, e.g. "+CMQNEW: 0,1,host" for AT+CMQNEW?
+
+        Returns
+        -----
+        bool : False if line is not such a reply, nothing is set then.
+        """
+        # Compared as str, slicing a bytearray is slower
+        line = line.decode(errors="replace")
+        prefix, sep, value = line.partition(":")
+        if not sep or prefix[:1] != "+" or "\r\n" in value:
+            return False
+        # Short, the long AT+CMQPUB echo is only followed by OK
+        command = self._echo.decode(errors="replace")
+        size = len(prefix) + 2
+        if not command.startswith(prefix, 2) \
+                or command[size:size + 1] not in "=?":
+            return False
+        self.info[prefix] = [value.strip()]
+        self.response = [line]
+        self.result = "OK"
+        self.success = True
+        return True
+
+    @property
+    def echo(self) -> str:
+        return self._echo.decode(errors="replace")
+
+    def _split_msg(self, msg: str):
+        """Split the lines after the echo into info, urcs and result."""
+        lines = msg.split("\r\n")
+        # The last entry is empty, or a line which is not complete yet
+        lines.pop()
+        command = None
+        for line in lines:
+            if not line:
+                continue
+            if line == "OK":
+                self.result = line
+                self.success = True
+            elif line == "ERROR" or line.startswith("+CME ERROR"):
+                self.result = line
+                self.success = False
+            else:
+                prefix, sep, value = line.partition(":")
+                if not sep or prefix[0] not in "+*":
+                    prefix, value = "", line
+                elif self._echo:
+                    if command is None:
+                        # "AT+CMQNEW=..." replies with "+CMQNEW: ..."
+                        command = _command_prefix(self.echo)
+                    if prefix != command:
+                        self.urcs.append(line)
+                        continue
+                self.info.setdefault(prefix, []).append(value.strip())
+                if self.response is None:
+                    self.response = []
+                self.response.append(line)
+
+    def fields(self, prefix: str, line: int = 0) -> list[int | str] | None:
+        """Comma separated values of an information line
+
+        Numbers are converted to int and quotes are removed, e.g.
+        fields("+CMQNEW") is [0, 1, "host"] for '+CMQNEW: 0,1,"host"'.
+
+        Returns
+        -----
+        list[int | str] | None : None if there is no such line.
+        """
+        values = self.info.get(prefix)
+        if values is None or line >= len(values):
+            return None
+        return _split_fields(values[line])
 
     def __str__(self) -> str:
         msg = f"Echo:    {self.echo}\n"\
@@ -42,20 +305,43 @@ class AtMsg:
 
 class Sim7020x:
     """SIM7020X API Class"""
-    def __init__(self, dev: str, baud = 115200):
+    def __init__(self, dev: str, baud = 115200, keep_session: bool = False):
+        """
+        Parameters
+        -----
+        dev : str
+            Serial device of the modem
+        baud : int
+            Baud rate
+        keep_session : bool
+            Keep an existing MQTT connection, see resume_session. By default
+            it is torn down.
+        """
+        self._open(dev, baud)
+        self.hex_mode(False)
+        if not keep_session:
+            self.mqtt_teardown()
+
+    def _open(self, dev: str, baud: int):
+        """Open the serial port and reset the state"""
         self.ser = serial.Serial(dev, baud)
         """Serial interface for SIM7020x"""
         self.ser.timeout = 0.2 # 200ms timeout
+        self._rx = bytearray()
+        """Received bytes, not yet consumed by a command"""
+        self.urcs: deque[str] = deque(maxlen=64)
+        """Unsolicited result codes received outside of commands"""
         self._ts_last_cmd = time.monotonic()
         self._cmd_delay = 0.1 # 100ms between commands
         self._mqtt_id = None
+        self._mqtt_server = None
         self._mqtt_buffer = 0
-        self.hex_mode(False)
-        try:
-            if self.get_mqtt_connection():
-                self.mqtt_discon()
-        except IOError:
-            pass
+        self.stats = AtStats()
+        """Per command counters, see AtStats"""
+        self._cmd_started = (0.0, 0.0, 0)
+        """Throttle wait, send time and length of the current command"""
+        self._hex = None
+        """Current AT+CREVHEX state, None if unknown"""
 
     @property
     def cmd_delay(self):
@@ -80,6 +366,142 @@ class Sim7020x:
             return False
 
 
+    def _read_available(self, block: bool = False) -> int:
+        """Read all waiting bytes into the receive buffer
+
+        Parameters
+        -----
+        block : bool
+            Wait up to the serial timeout for at least one byte.
+
+        Returns
+        -----
+        int : Number of bytes read
+        """
+        waiting = self.ser.in_waiting
+        if waiting == 0 and not block:
+            return 0
+        chunk = self.ser.read(max(waiting, 1))
+        self._rx += chunk
+        return len(chunk)
+
+    def _collect_urcs(self):
+        """Move complete lines in the receive buffer to urcs"""
+        end = self._rx.rfind(b"\r\n")
+        if end < 0:
+            return
+        for line in bytes(self._rx[:end]).split(b"\r\n"):
+            line = line.strip()
+            if line:
+                self.urcs.append(line.decode(errors="replace"))
+        del self._rx[:end + 2]
+
+    def read_urcs(self) -> list[str]:
+        """Return and clear unsolicited result codes received so far"""
+        self._read_available()
+        self._collect_urcs()
+        urcs = list(self.urcs)
+        self.urcs.clear()
+        return urcs
+
+    def _take_urc(self, prefixes: tuple[str, ...]) -> str | None:
+        """Remove and return the first URC starting with one of prefixes"""
+        self._collect_urcs()
+        for urc in self.urcs:
+            if urc.startswith(prefixes):
+                self.urcs.remove(urc)
+                return urc
+        return None
+
+    def wait_urc(self,
+                 prefixes: tuple[str, ...],
+                 timeout: float) -> str | None:
+        """Wait for a unsolicited result code, e.g. ("+CEREG:",)
+
+        The matching URC is removed from urcs, others are kept.
+
+        Returns
+        -----
+        str | None : The URC, or None on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            urc = self._take_urc(prefixes)
+            remaining = deadline - time.monotonic()
+            if urc is not None or remaining <= 0:
+                return urc
+            if remaining < self.ser.timeout:
+                time.sleep(remaining)
+                self._read_available()
+            else:
+                self._read_available(block=True)
+
+    def _cmd_wait(self) -> float:
+        """Time left of the minimum delay between commands"""
+        return max(self._ts_last_cmd + self.cmd_delay - time.monotonic(), 0)
+
+    def _start_command(self, at_cmd: str, wait: float = 0) -> bytes:
+        """Keep anything received between commands as URCs, and return
+        the encoded command"""
+        self._collect_urcs()
+        self._rx.clear()
+        cmd = at_cmd.encode() + b'\r\n'
+        self._cmd_started = (wait, time.monotonic(), len(cmd))
+        return cmd
+
+    def _scan_reply(self, line_start: int) -> tuple[int, int, bool]:
+        """Scan new lines in the receive buffer for a final result code
+
+        Returns
+        -----
+        line_start : int
+            Start of the first line, which is not scanned yet.
+        end : int
+            End of the final result code, -1 if not received yet.
+        success : bool
+            True if the final result code is OK.
+        """
+        reply = self._rx
+        idx = reply.find(b"\r\n", line_start)
+        while idx >= 0:
+            line = reply[line_start:idx]
+            line_start = idx + 2
+            if line == b"OK":
+                return line_start, line_start, True
+            if line == b"ERROR" or line.startswith(b"+CME ERROR"):
+                return line_start, line_start, False
+            idx = reply.find(b"\r\n", line_start)
+        return line_start, -1, False
+
+    def _finish_command(self,
+                        at_cmd: str,
+                        end: int,
+                        success: bool,
+                        timed_out: bool) -> AtMsg:
+        """Consume the reply from the receive buffer
+
+        Raises
+        -----
+        IOError
+            If the command failed or timed out.
+        """
+        reply = self._rx
+        wait, sent, written = self._cmd_started
+        self.stats.record(at_cmd, wait, time.monotonic() - sent, written,
+                          end if end >= 0 else len(reply), success, timed_out)
+        if success is False:
+            response = bytes(reply)
+            reply.clear()
+            raise IOError(f"Error sending command: {at_cmd}\n"\
+                          f"Response: {response}\nTimeout {timed_out}")
+
+        self._ts_last_cmd = time.monotonic()
+        msg = AtMsg(reply, end)
+        self.urcs.extend(msg.urcs)
+        # Bytes after the final result code are kept for the URCs.
+        del reply[:end]
+        return msg
+
     def _send_at_command(
             self,
             at_cmd: str,
@@ -94,37 +516,24 @@ class Sim7020x:
             Timeout in s
         """
         # Wait for minimum time between commands.
-        time_now = time.monotonic()
-        if time_now - self._ts_last_cmd < self.cmd_delay:
-            sleep_time = (self._ts_last_cmd+self.cmd_delay) - time_now
+        sleep_time = self._cmd_wait()
+        if sleep_time > 0:
             time.sleep(sleep_time)
 
-        success: bool = False
-        self.ser.read_all() # Empty buffer
-        self.ser.write(at_cmd.encode() + b'\r\n')
+        self._read_available()
+        self.ser.write(self._start_command(at_cmd, sleep_time))
 
-        # Check for OK.
-        reply = b""
+        # Scan each received line for the final result code.
+        line_start = 0
+        end = -1
+        success = False
         starttime = time.monotonic()
+        while end < 0 and time.monotonic() - starttime < timeout:
+            if self._read_available(block=True) > 0:
+                line_start, end, success = self._scan_reply(line_start)
 
-        while time.monotonic() - starttime < timeout:
-            reply += self.ser.read(1)
-            if reply.endswith(b'OK\r\n'):
-                success = True
-                break
-            elif reply.endswith(b'ERROR\r\n'):
-                break
-
-        if success is False:
-            timeout_s = False
-            if time.monotonic() - starttime > timeout:
-                timeout_s = True
-            raise IOError(f"Error sending command: {at_cmd}\nResponse: {reply}"\
-                          f"\nTimeout {timeout_s}")
-
-        self._ts_last_cmd = time.monotonic()
-        reply = AtMsg(reply)
-        return reply
+        timed_out = end < 0
+        return self._finish_command(at_cmd, end, success, timed_out)
 
 
     # ----- Generic -----
@@ -176,18 +585,45 @@ class Sim7020x:
     def connected_operator(self) -> bool:
         """Return True if the modem has connected to an operator"""
         status = self.get_cops()
-        if status.response is None:
-            return False
-
-        return True
+        return "+COPS" in status.info
 
     def connected_network(self) -> bool:
         """Return True if the modem has established an PDP connection"""
         status = self.get_pdp_context()
-        if status.response is None:
-            return False
+        return "+CGCONTRDP" in status.info
 
-        return True
+    def enable_registration_urcs(self):
+        """Report registration changes as +CEREG URCs, AT+CEREG=1"""
+        reply = self._send_at_command("AT+CEREG=1")
+        return reply
+
+    def wait_network(self, timeout: float = 120, max_poll: float = 5) -> float:
+        """Wait for network registration and a PDP context
+
+        Registration is detected from +CEREG/+CGREG URCs, see
+        enable_registration_urcs. The PDP context is polled with exponential
+        backoff as a fallback, up to max_poll seconds between polls.
+
+        Returns
+        -----
+        float : Seconds waited
+
+        Raises
+        -----
+        TimeoutError
+            If no PDP context is established within timeout.
+        """
+        start = time.monotonic()
+        delay = 0.1
+        while not self.connected_network():
+            remaining = start + timeout - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No network after {timeout} s")
+            urc = self.wait_urc(_REG_URCS, min(delay, remaining))
+            if urc is None:
+                delay = min(delay * 2, max_poll)
+            self.stats.retries += 1
+        return time.monotonic() - start
 
 
     _pdp_mode = Literal["IP", "IPV6", "IPV4V6", "Non-IP"]
@@ -225,6 +661,7 @@ class Sim7020x:
     def hex_mode(self, state: bool):
         """Send message as HEX or raw"""
         reply = self._send_at_command(f"AT+CREVHEX={int(state)}")
+        self._hex = state
         return reply
 
     # ----- MQTT -----
@@ -261,12 +698,49 @@ class Sim7020x:
     def get_mqtt_connection(self) -> bool:
         """Check if a MQTT server connection is established"""
         reply = self._send_at_command("AT+CMQNEW?", 1)
-        connection = reply.response[0].split(",")
-        if connection[2] == "null":
+        return self._parse_mqtt_connection(reply)
+
+    def _parse_mqtt_connection(self, reply: AtMsg) -> bool:
+        """Save the MQTT ID and server from a AT+CMQNEW? reply"""
+        connection = reply.fields("+CMQNEW")
+        if connection is None or len(connection) < 3 \
+                or connection[2] == "null":
             return False
-        else:
-            self._mqtt_id = int(connection[0][-1])
-            return True
+        self._mqtt_id = connection[0]
+        self._mqtt_server = connection[2]
+        return True
+
+    def mqtt_teardown(self):
+        """Disconnect an existing MQTT connection, e.g. of a previous run"""
+        try:
+            if self.get_mqtt_connection():
+                self.mqtt_discon()
+        except IOError:
+            pass
+
+    def resume_session(self, server: str, buffer_size: int = 512) -> bool:
+        """Reuse the PDP context and MQTT session of a previous run
+
+        The session is reused if the network is up, and the MQTT connection
+        is to server and connected. The modem does not report the client ID
+        and buffer size of a connection, so they must be the ones used in
+        the previous run.
+
+        Returns
+        -----
+        bool : True if the session can be used for publishing.
+        """
+        try:
+            if not self.connected_network():
+                return False
+            if not self.get_mqtt_connection() or self._mqtt_server != server:
+                return False
+            if not self.mqtt_connected():
+                return False
+        except IOError:
+            return False
+        self._mqtt_buffer = buffer_size
+        return True
 
 
 
@@ -288,6 +762,56 @@ class Sim7020x:
         keep_alive_interval : int
             Keep alive interval in seconds
         """
+        reply = self._send_at_command(
+            self._mqtt_connection_cmd(version, client_id, keep_alive_interval,
+                                      cleansession, username, password)
+        )
+        self.wait_mqtt_ready()
+        return reply
+
+    def mqtt_connected(self) -> bool:
+        """Return True if the MQTT session is connected, AT+CMQCON?"""
+        reply = self._send_at_command("AT+CMQCON?", 1)
+        return self._parse_mqtt_connected(reply)
+
+    def _parse_mqtt_connected(self, reply: AtMsg) -> bool:
+        """Find the state of the MQTT ID in a AT+CMQCON? reply"""
+        for line in range(len(reply.info.get("+CMQCON", []))):
+            fields = reply.fields("+CMQCON", line)
+            if len(fields) > 1 and fields[0] == self._mqtt_id:
+                return fields[1] == 1
+        return False
+
+    def wait_mqtt_ready(self, timeout: float = 10, max_poll: float = 1):
+        """Wait until the MQTT session is connected and ready to publish
+
+        Polls AT+CMQCON? with exponential backoff, and wakes up on +CMQCON
+        URCs.
+
+        Raises
+        -----
+        TimeoutError
+            If the session is not connected within timeout.
+        """
+        start = time.monotonic()
+        delay = 0.1
+        while not self.mqtt_connected():
+            remaining = start + timeout - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"MQTT not connected after {timeout} s")
+            urc = self.wait_urc(("+CMQCON:",), min(delay, remaining))
+            if urc is None:
+                delay = min(delay * 2, max_poll)
+            self.stats.retries += 1
+
+    def _mqtt_connection_cmd(self,
+                             version: _mqtt_version,
+                             client_id: str,
+                             keep_alive_interval: int,
+                             cleansession: bool,
+                             username: str,
+                             password: str) -> str:
+        """AT+CMQCON command, see mqtt_connection"""
         ver = 3 if version=="MQTT 3.1" else 4
         c_val = 1 if cleansession is True else 0
 
@@ -297,12 +821,8 @@ class Sim7020x:
         if password != "":
             suffix += f",\"{password}\""
 
-        reply = self._send_at_command(
-            f"AT+CMQCON={self._mqtt_id},{ver},\"{client_id}\","\
-            f"{keep_alive_interval},{c_val},0{suffix}"
-        )
-        time.sleep(2) # Needed to consistently be able to Publish.
-        return reply
+        return f"AT+CMQCON={self._mqtt_id},{ver},\"{client_id}\","\
+               f"{keep_alive_interval},{c_val},0{suffix}"
 
 
     def mqtt_discon(self):
@@ -315,28 +835,370 @@ class Sim7020x:
     def mqtt_publish(
             self,
             topic: str,
-            message: str,
+            message: str | bytes,
             qos: int = 2):
         """Publish a MQTT message to the server
 
+        Text is sent as is. Bytes are sent hex encoded with AT+CREVHEX=1,
+        so they may hold any value. The modem is only switched between the
+        modes when the message type changes.
+
         Parameters
         -----
         topic : str
             MQTT Topic to publish the message under
-        message : str
-            Message to publish
+        message : str | bytes
+            Message to publish, at most _mqtt_buffer characters, or half of
+            it in bytes.
         qos : int
             MQTT QoS, 0: At most once\n
             1: At least once\n 2: Exactly once
         """
-        message = message.replace("\n", "").replace("\r","") # Remove CRLF
-        if len(message) > self._mqtt_buffer:
-            raise ValueError(f"Message is {len(message)} characters "\
-                             f"And most not exceed {self._mqtt_buffer}")
+        hex_mode, cmd = self._mqtt_publish_cmd(topic, message, qos)
+        if self._hex != hex_mode:
+            self.hex_mode(hex_mode)
+        reply = self._send_at_command(cmd)
+        return reply
+
+    def _mqtt_publish_cmd(self,
+                          topic: str,
+                          message: str | bytes,
+                          qos: int) -> tuple[bool, str]:
+        """Return the needed hex mode and the AT+CMQPUB command"""
+        hex_mode = isinstance(message, (bytes, bytearray, memoryview))
+        if hex_mode:
+            # Two hex characters per byte, counted against the buffer.
+            message = bytes(message).hex().upper()
+            if len(message) > self._mqtt_buffer:
+                raise ValueError(f"Message is {len(message) // 2} bytes "\
+                                 f"And most not exceed "\
+                                 f"{self._mqtt_buffer // 2}")
+        else:
+            message = message.replace("\n", "").replace("\r","") # Remove CRLF
+            if len(message) > self._mqtt_buffer:
+                raise ValueError(f"Message is {len(message)} characters "\
+                                 f"And most not exceed {self._mqtt_buffer}")
         retained = 0
         dup = 0
-        reply = self._send_at_command(
-            f"AT+CMQPUB={self._mqtt_id},\"{topic}\",{qos},{retained},"\
-            f"{dup},{len(message)},\"{message}\""
+        return hex_mode, f"AT+CMQPUB={self._mqtt_id},\"{topic}\",{qos},"\
+                         f"{retained},{dup},{len(message)},\"{message}\""
+
+
+class AsyncSim7020x(Sim7020x):
+    """SIM7020X API for asyncio
+
+    Create with ``await AsyncSim7020x.create(dev)``. The serial port is
+    read by the event loop, so commands never block the loop, and the
+    command methods are awaited. Commands run one at a time.
+    Methods which only send a command are inherited from Sim7020x, and
+    return the awaitable from _send_at_command.
+    """
+    def __init__(self, dev: str, baud = 115200):
+        """Open the port without talking to the modem, see create"""
+        self._open(dev, baud)
+        self._fd = self.ser.fileno()
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self._data = asyncio.Event()
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    @classmethod
+    async def create(cls, dev: str, baud = 115200, keep_session: bool = False):
+        """Open the modem, and tear down an existing MQTT connection unless
+        keep_session is set"""
+        sim = cls(dev, baud)
+        await sim.hex_mode(False)
+        if not keep_session:
+            await sim.mqtt_teardown()
+        return sim
+
+    async def mqtt_teardown(self):
+        """Disconnect an existing MQTT connection, e.g. of a previous run"""
+        try:
+            if await self.get_mqtt_connection():
+                await self.mqtt_discon()
+        except IOError:
+            pass
+
+    async def resume_session(self, server: str, buffer_size: int = 512) -> bool:
+        """Reuse the PDP context and MQTT session of a previous run, see
+        Sim7020x.resume_session"""
+        try:
+            if not await self.connected_network():
+                return False
+            if not await self.get_mqtt_connection() \
+                    or self._mqtt_server != server:
+                return False
+            if not await self.mqtt_connected():
+                return False
+        except IOError:
+            return False
+        self._mqtt_buffer = buffer_size
+        return True
+
+    def close(self):
+        """Stop reading and close the serial port"""
+        self._loop.remove_reader(self._fd)
+        self.ser.close()
+
+    def _on_readable(self):
+        try:
+            chunk = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        if chunk:
+            self._rx += chunk
+            self._data.set()
+
+    async def _write(self, data: bytes):
+        view = memoryview(data)
+        while len(view) > 0:
+            try:
+                view = view[os.write(self._fd, view):]
+            except BlockingIOError:
+                pass
+            if len(view) > 0:
+                writable = self._loop.create_future()
+                self._loop.add_writer(self._fd, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    self._loop.remove_writer(self._fd)
+
+    async def _send_at_command(
+            self,
+            at_cmd: str,
+            timeout: float = 3):
+        """ Send a AT command to the modem
+
+        Parameters
+        -----
+        at_cmd : str
+            AT CMD for the modem
+        timeout : float
+            Timeout in s
+        """
+        async with self._lock:
+            return await self._send_locked(at_cmd, timeout)
+
+    async def _send_locked(self, at_cmd: str, timeout: float = 3):
+        """_send_at_command, for callers already holding the lock"""
+        sleep_time = self._cmd_wait()
+        if sleep_time > 0:
+            await asyncio.sleep(sleep_time)
+
+        await self._write(self._start_command(at_cmd, sleep_time))
+
+        line_start = 0
+        end = -1
+        success = False
+        deadline = self._loop.time() + timeout
+        while True:
+            line_start, end, success = self._scan_reply(line_start)
+            remaining = deadline - self._loop.time()
+            if end >= 0 or remaining <= 0:
+                break
+            self._data.clear()
+            try:
+                await asyncio.wait_for(self._data.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        return self._finish_command(at_cmd, end, success, end < 0)
+
+    async def connected_operator(self) -> bool:
+        """Return True if the modem has connected to an operator"""
+        status = await self.get_cops()
+        return "+COPS" in status.info
+
+    async def connected_network(self) -> bool:
+        """Return True if the modem has established an PDP connection"""
+        status = await self.get_pdp_context()
+        return "+CGCONTRDP" in status.info
+
+    async def wait_urc(self,
+                       prefixes: tuple[str, ...],
+                       timeout: float) -> str | None:
+        """Wait for a unsolicited result code, see Sim7020x.wait_urc"""
+        deadline = self._loop.time() + timeout
+        while True:
+            urc = self._take_urc(prefixes)
+            remaining = deadline - self._loop.time()
+            if urc is not None or remaining <= 0:
+                return urc
+            self._data.clear()
+            try:
+                await asyncio.wait_for(self._data.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_network(self,
+                           timeout: float = 120,
+                           max_poll: float = 5) -> float:
+        """Wait for network registration and a PDP context, see
+        Sim7020x.wait_network"""
+        start = self._loop.time()
+        delay = 0.1
+        while not await self.connected_network():
+            remaining = start + timeout - self._loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"No network after {timeout} s")
+            urc = await self.wait_urc(_REG_URCS, min(delay, remaining))
+            if urc is None:
+                delay = min(delay * 2, max_poll)
+            self.stats.retries += 1
+        return self._loop.time() - start
+
+    async def mqtt_connected(self) -> bool:
+        """Return True if the MQTT session is connected, AT+CMQCON?"""
+        reply = await self._send_at_command("AT+CMQCON?", 1)
+        return self._parse_mqtt_connected(reply)
+
+    async def wait_mqtt_ready(self, timeout: float = 10, max_poll: float = 1):
+        """Wait until the MQTT session is connected, see
+        Sim7020x.wait_mqtt_ready"""
+        start = self._loop.time()
+        delay = 0.1
+        while not await self.mqtt_connected():
+            remaining = start + timeout - self._loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"MQTT not connected after {timeout} s")
+            urc = await self.wait_urc(("+CMQCON:",), min(delay, remaining))
+            if urc is None:
+                delay = min(delay * 2, max_poll)
+            self.stats.retries += 1
+
+    async def mqtt_new(
+            self,
+            ip: str,
+            port: int,
+            timeout: int = 10000,
+            buffer_size: int = 512):
+        """Establish a MQTT connection to a server, see Sim7020x.mqtt_new"""
+        reply = await self._send_at_command(
+            f"AT+CMQNEW=\"{ip}\",\"{port}\",{timeout},{buffer_size}",
+            10
         )
+        await self.get_mqtt_connection()
+        self._mqtt_buffer = buffer_size
         return reply
+
+    async def get_mqtt_connection(self) -> bool:
+        """Check if a MQTT server connection is established"""
+        reply = await self._send_at_command("AT+CMQNEW?", 1)
+        return self._parse_mqtt_connection(reply)
+
+    async def mqtt_connection(
+            self,
+            version: Sim7020x._mqtt_version,
+            client_id: str,
+            keep_alive_interval: int,
+            cleansession: bool = False,
+            username: str = "",
+            password: str = ""):
+        """Establish a session, see Sim7020x.mqtt_connection"""
+        reply = await self._send_at_command(
+            self._mqtt_connection_cmd(version, client_id, keep_alive_interval,
+                                      cleansession, username, password)
+        )
+        await self.wait_mqtt_ready()
+        return reply
+
+    async def hex_mode(self, state: bool):
+        """Send message as HEX or raw"""
+        reply = await self._send_at_command(f"AT+CREVHEX={int(state)}")
+        self._hex = state
+        return reply
+
+    async def mqtt_publish(
+            self,
+            topic: str,
+            message: str | bytes,
+            qos: int = 2):
+        """Publish a MQTT message, see Sim7020x.mqtt_publish"""
+        hex_mode, cmd = self._mqtt_publish_cmd(topic, message, qos)
+        # Held from the mode check to the publish, so concurrent publishes
+        # of text and bytes can not switch the mode in between.
+        async with self._lock:
+            if self._hex != hex_mode:
+                await self._send_locked(f"AT+CREVHEX={int(hex_mode)}")
+                self._hex = hex_mode
+            return await self._send_locked(cmd)
+
+
+class AtCommandWorker:
+    """Run Sim7020x commands in order on a worker thread.
+
+    The worker owns the serial port, so once it is started all commands
+    must be submitted through it. Each submission returns a Future.
+    """
+    def __init__(self, sim: Sim7020x, maxsize: int = 0):
+        """
+        Parameters
+        -----
+        sim : Sim7020x
+            Modem to run the commands on
+        maxsize : int
+            Maximum number of queued commands, 0 for unbounded.
+        """
+        self.sim = sim
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run,
+                                        name="aauiot-sim7020",
+                                        daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        """Number of queued commands"""
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, func, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as err:
+                future.set_exception(err)
+            else:
+                future.set_result(result)
+
+    def submit(self,
+               func: Callable,
+               *args,
+               block: bool = True,
+               timeout: float | None = None,
+               **kwargs) -> Future:
+        """Queue func(*args, **kwargs) to run on the worker
+
+        Parameters
+        -----
+        func : Callable
+            Typically a Sim7020x method, e.g. sim.mqtt_publish
+        block : bool
+            Wait for room in the queue, otherwise raise queue.Full.
+        timeout : float | None
+            Maximum wait for room in the queue, when block is set.
+
+        Raises
+        -----
+        queue.Full
+            If the queue is full.
+        RuntimeError
+            If the worker has been shut down.
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("The AT command worker is shut down")
+        future = Future()
+        self._queue.put((future, func, args, kwargs), block, timeout)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker after the queued commands have run"""
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
@@ -0,0 +1,253 @@
+#%%
+"""Simulated sensor backends, for running aau_iot without a Pi.
+
+The backends create stand-ins for the BME680, VEML7700 and SGP30 drivers,
+which expose the attributes used by aau_iot. Values are sampled and held,
+and refreshed at most at the backend rate, like the BME680 driver.
+"""
+import bisect
+import math
+import random
+import time
+from typing import Callable
+
+# Register value to integration time in ms and gain, as the VEML7700 driver
+_INT_TIME_MS = {0x0C: 25, 0x08: 50, 0x00: 100, 0x01: 200, 0x02: 400,
+                0x03: 800}
+_GAIN = {0x0: 1, 0x1: 2, 0x2: 0.125, 0x3: 0.25}
+
+
+class _sim_driver:
+    """Sample and hold of the source channels, refreshed at most at rate"""
+    def __init__(self, source: Callable[[str], float], rate: float):
+        self._source = source
+        self._min_refresh_time = 1 / rate
+        self._last_reading = -math.inf
+        self._values = {}
+
+    def _perform_reading(self):
+        now = time.monotonic()
+        if now - self._last_reading < self._min_refresh_time:
+            return
+        self._last_reading = now
+        self._values = {}
+
+    def _read(self, channel: str) -> float:
+        self._perform_reading()
+        # Channels are held from their first read after a refresh.
+        if channel not in self._values:
+            self._values[channel] = self._source(channel)
+        return self._values[channel]
+
+
+class _sim_bme680(_sim_driver):
+    def __init__(self, source: Callable[[str], float], rate: float):
+        super().__init__(source, rate)
+        self.temperature_oversample = 8
+        self.humidity_oversample = 2
+        self.pressure_oversample = 4
+
+    @property
+    def temperature(self) -> float:
+        return self._read("temperature")
+
+    @property
+    def humidity(self) -> float:
+        return self._read("humidity")
+
+    @property
+    def pressure(self) -> float:
+        return self._read("pressure")
+
+
+class _sim_veml7700(_sim_driver):
+    def __init__(self, source: Callable[[str], float], rate: float):
+        super().__init__(source, rate)
+        self.light_integration_time = 0x00
+        self.light_gain = 0x0
+
+    def integration_time_value(self) -> int:
+        return _INT_TIME_MS[self.light_integration_time]
+
+    def gain_value(self) -> float:
+        return _GAIN[self.light_gain]
+
+    @property
+    def autolux(self) -> float:
+        return self._read("light")
+
+    @property
+    def lux(self) -> float:
+        return self._read("light")
+
+
+class _sim_sgp30(_sim_driver):
+    @property
+    def TVOC(self) -> int:
+        return round(self._read("tvoc"))
+
+    @property
+    def eCO2(self) -> int:
+        return round(self._read("eco2"))
+
+    @property
+    def baseline_TVOC(self) -> int:
+        return 0x8000
+
+    @property
+    def baseline_eCO2(self) -> int:
+        return 0x8000
+
+
+class _sim_backend:
+    """Creates simulated drivers, reading values from _source"""
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self._rate = rate
+
+    def _source(self, channel: str) -> float:
+        raise NotImplementedError()
+
+    def bme680(self) -> _sim_bme680:
+        return _sim_bme680(self._source, self._rate)
+
+    def veml7700(self) -> _sim_veml7700:
+        return _sim_veml7700(self._source, self._rate)
+
+    def sgp30(self) -> _sim_sgp30:
+        return _sim_sgp30(self._source, self._rate)
+
+
+class SimulatedBackend(_sim_backend):
+    """Synthetic sensor values, a slow sine around a baseline plus noise"""
+    # channel: (baseline, amplitude, noise std, minimum)
+    channels = {
+        "temperature": (22.0, 2.0, 0.05, -40.0),
+        "humidity": (40.0, 5.0, 0.2, 0.0),
+        "pressure": (1013.0, 2.0, 0.05, 300.0),
+        "light": (300.0, 250.0, 5.0, 0.0),
+        "tvoc": (50.0, 20.0, 3.0, 0.0),
+        "eco2": (450.0, 50.0, 5.0, 400.0),
+    }
+
+    def __init__(self,
+                 rate: float = 100,
+                 noise: float = 1.0,
+                 period: float = 86400,
+                 seed: int | None = None):
+        """
+        Parameters
+        -----
+        rate : float
+            Highest rate in Hz new values are generated, reads in between
+            return the previous value.
+        noise : float
+            Scale of the default noise of each channel, 0 for none.
+        period : float
+            Period in seconds of the slow variation.
+        seed : int | None
+            Seed for the noise, for reproducible runs.
+        """
+        super().__init__(rate)
+        self._noise = noise
+        self._period = period
+        self._rng = random.Random(seed)
+        # Random phase, so virtual kits do not move in lockstep.
+        self._phase = self._rng.uniform(0, 2 * math.pi)
+
+    def _source(self, channel: str) -> float:
+        baseline, amplitude, noise, minimum = self.channels[channel]
+        angle = 2 * math.pi * time.time() / self._period + self._phase
+        val = baseline + amplitude * math.sin(angle) \
+            + self._rng.gauss(0, noise * self._noise)
+        return max(val, minimum)
+
+
+class ReplayBackend(_sim_backend):
+    """Replay a CSV file, as produced by aau_iot.download.
+
+    Each line holds "userid, <group>, <topic>, <value>, sample_timestamp,
+    <HH:MM:SS>, ...". The topic of each channel is set with channels.
+    """
+    def __init__(self,
+                 path: str,
+                 channels: dict[str, str] | None = None,
+                 speed: float | None = 1.0,
+                 loop: bool = True,
+                 rate: float = 100):
+        """
+        Parameters
+        -----
+        path : str
+            CSV file to replay
+        channels : dict[str, str] | None
+            Topic in the file for each channel: "temperature", "humidity",
+            "pressure", "light", "tvoc" and "eco2". Channels default to a
+            topic of the same name.
+        speed : float | None
+            Replay speed relative to real time, None steps one sample forward
+            on every refresh, as fast as it is read.
+        loop : bool
+            Restart from the beginning at the end of the trace.
+        rate : float
+            Highest rate in Hz values are refreshed.
+        """
+        super().__init__(rate)
+        self._channels = dict(channels or {})
+        self._speed = speed
+        self._loop = loop
+        self._traces = self._load(path)
+        self._step = {}
+        self._start = time.monotonic()
+
+    @staticmethod
+    def _load(path: str) -> dict[str, tuple[list[float], list[float]]]:
+        """Return topic: (seconds from first sample, values)"""
+        traces = {}
+        with open(path) as f:
+            for line in f:
+                fields = [field.strip() for field in line.split(",")]
+                if len(fields) < 6 or fields[4] != "sample_timestamp":
+                    continue
+                try:
+                    val = float(fields[3])
+                    hours, mins, secs = fields[5].split(":")
+                    sec = int(hours) * 3600 + int(mins) * 60 + int(secs)
+                except ValueError:
+                    continue
+                times, vals = traces.setdefault(fields[2], ([], []))
+                times.append(sec)
+                vals.append(val)
+
+        # Seconds from the first sample, unwrapping midnight
+        for topic, (times, vals) in traces.items():
+            first = times[0]
+            day = 0
+            unwrapped = [0.0]
+            for prev, sec in zip(times, times[1:]):
+                if sec < prev:
+                    day += 86400
+                unwrapped.append(sec + day - first)
+            traces[topic] = (unwrapped, vals)
+        return traces
+
+    def _source(self, channel: str) -> float:
+        topic = self._channels.get(channel, channel)
+        if topic not in self._traces:
+            raise ValueError(f"No samples for {channel} in the trace, "\
+                             f"topics are: {list(self._traces)}")
+        times, vals = self._traces[topic]
+        if self._speed is None:
+            idx = self._step.get(channel, 0)
+            self._step[channel] = idx + 1
+        else:
+            elapsed = (time.monotonic() - self._start) * self._speed
+            if self._loop:
+                # Leave one mean sample interval between repetitions.
+                duration = times[-1] + (times[-1] / max(len(times) - 1, 1))
+                elapsed %= max(duration, 1)
+            idx = bisect.bisect_right(times, elapsed) - 1
+        if self._loop:
+            idx %= len(vals)
+        return vals[min(idx, len(vals) - 1)]
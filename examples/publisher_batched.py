@@ -0,0 +1,28 @@
+import time
+from aauiot import aau_iot, MqttBatcher
+
+# Insert server IP and your Group Name
+SERVER = "130.225.37.241"
+GROUP_ID = "group"
+
+
+if __name__ == "__main__":
+    iot = aau_iot(SERVER, GROUP_ID)
+    iot.mqtt_connect("NBIoT")
+
+    # Messages are sent once they fill the modem buffer, or after 60 s.
+    batcher = MqttBatcher(iot.mqtt, max_age=60)
+
+    SAMPLES = 300
+    SENSOR1 = "light"
+    SENSOR2 = "temp"
+
+    for _ in range(SAMPLES):
+        batcher.add(SENSOR1, *iot.light())
+        batcher.add(SENSOR2, *iot.temperature())
+        time.sleep(1)
+
+    batcher.flush()
+    time.sleep(3)
+    iot.mqtt.discon()
+    exit()
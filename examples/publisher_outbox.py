@@ -0,0 +1,29 @@
+import time
+from aauiot import aau_iot, MqttBatcher, Outbox
+
+# Insert server IP and your Group Name
+SERVER = "130.225.37.241"
+GROUP_ID = "group"
+
+
+if __name__ == "__main__":
+    iot = aau_iot(SERVER, GROUP_ID)
+    iot.mqtt_connect("NBIoT")
+
+    # Samples are stored on disk, and sent once the modem is back in coverage.
+    outbox = Outbox(iot.mqtt, "outbox.db")
+    outbox.start()
+    batcher = MqttBatcher(outbox, max_age=60)
+
+    SAMPLES = 3600
+    SENSOR = "temp"
+
+    for _ in range(SAMPLES):
+        batcher.add(SENSOR, *iot.temperature())
+        time.sleep(1)
+
+    batcher.flush()
+    outbox.drain(force=True)
+    outbox.close()
+    iot.mqtt.discon()
+    exit()
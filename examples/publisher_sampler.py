@@ -0,0 +1,30 @@
+import time
+from aauiot import aau_iot
+
+# Insert server IP and your Group Name
+SERVER = "130.225.37.241"
+GROUP_ID = "group"
+
+
+if __name__ == "__main__":
+    iot = aau_iot(SERVER, GROUP_ID)
+    iot.mqtt_connect("NBIoT")
+
+    # Sensors are sampled in the background, publishing does not stall them.
+    sampler = iot.start_sampling({"light": 2, "temperature": 1})
+
+    # The group id is prepended to the message
+    BUFSIZE = iot.mqtt.max_payload - len(GROUP_ID) - 1
+    ITERATIONS = 10
+    for _ in range(ITERATIONS):
+        time.sleep(30)
+        for sensor in ("light", "temperature"):
+            data = sampler.drain_data(sensor, bufsize=BUFSIZE)
+            while data is not None:
+                iot.mqtt.send_topics(data)
+                data = sampler.drain_data(sensor, bufsize=BUFSIZE)
+
+    iot.stop_sampling()
+    time.sleep(3)
+    iot.mqtt.discon()
+    exit()
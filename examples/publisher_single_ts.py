@@ -1,5 +1,5 @@
 import time
-from aauiot import aau_iot, MqttData
+from aauiot import aau_iot, MqttData, MqttMultiData
 
 # Insert server IP and your Group Name
 SERVER = "130.225.37.241"
@@ -26,8 +26,8 @@ if __name__ == "__main__":
             data_temp.add_measurement(sample)
             time.sleep(1)
 
-        iot.mqtt.send_topics(data_light)
-        iot.mqtt.send_topics(data_temp)
+        # Both sensors are sent in one message on the "multiple" topic
+        iot.mqtt.send_topics(MqttMultiData([data_light, data_temp]))
 
     time.sleep(3)
     iot.mqtt.discon()
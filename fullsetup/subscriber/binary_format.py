@@ -0,0 +1,59 @@
+"""Decoder for the binary wire format published under "aauiot/bin/" by aauiot.
+
+Layout, see aauiot._core._encode_binary:
+magic (u8), version (u8), flags (u8), scale (i8),
+len(userid) (u8), userid, len(identifier) (u8), identifier,
+n_vals (varint), n_ts (varint),
+first timestamp in seconds of the day (varint),
+n_ts-1 timestamp deltas modulo 24 h (varint),
+values as big endian float32, or zigzag varint of val * 10**scale.
+"""
+import struct
+
+BIN_MAGIC = 0xA5
+BIN_VERSION = 1
+BIN_FLAG_SCALED = 0x01
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def decode_binary(data):
+    """Decode the binary wire format into userid, topic, payloads and timestamps,
+    formatted the same way as the ASCII payload."""
+    magic, version, flags, scale, uid_len = struct.unpack_from(">BBBbB", data, 0)
+    if magic != BIN_MAGIC or version != BIN_VERSION:
+        raise ValueError("unknown binary format "+str(magic)+" v"+str(version))
+    pos = 5
+    userid = data[pos:pos+uid_len].decode('UTF-8')
+    pos += uid_len
+    ident_len = data[pos]
+    pos += 1
+    topic = data[pos:pos+ident_len].decode('UTF-8')
+    pos += ident_len
+    n_vals, pos = read_varint(data, pos)
+    n_ts, pos = read_varint(data, pos)
+
+    timestamps = []
+    sec = 0
+    for i in range(n_ts):
+        delta, pos = read_varint(data, pos)
+        sec = (sec + delta) % 86400
+        timestamps.append("%02d:%02d:%02d" % (sec // 3600, sec // 60 % 60, sec % 60))
+
+    if flags & BIN_FLAG_SCALED:
+        vals = []
+        for i in range(n_vals):
+            zigzag, pos = read_varint(data, pos)
+            vals.append(((zigzag >> 1) ^ -(zigzag & 1)) / 10**scale)
+    else:
+        vals = struct.unpack_from(">"+str(n_vals)+"f", data, pos)
+    payloads = ["%.4g" % val for val in vals]
+    return userid, topic, payloads, timestamps
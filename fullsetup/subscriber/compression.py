@@ -0,0 +1,32 @@
+"""Decompression of payloads published under "aauiot/z/" by aauiot.
+
+Layout, see aauiot._core._compress:
+codec (u8), raw deflate stream of the payload.
+Codec 1 is plain deflate, codec 2 deflate with the preset dictionary below,
+which must match aauiot._core._ZDICT.
+"""
+import zlib
+
+Z_TOPIC = "z/"
+Z_DEFLATE = 0x01
+Z_DEFLATE_DICT = 0x02
+ZDICT = ("comtek-6-group,gas,pressure,humidity,environment,multiple,light,"
+         "temp,ts,00:00:00,12:00:00,12:00:01,12:00:02,12:00:03,12:00:04,"
+         ",0.1,1.2,12.3,21.5,123.4,1013,1234").encode()
+
+def decompress(data):
+    """Return the original payload of a compressed message, raises ValueError
+    for an unknown codec and zlib.error for a corrupt stream."""
+    if len(data) == 0:
+        raise ValueError("empty payload")
+    codec = data[0]
+    if codec == Z_DEFLATE:
+        decompressor = zlib.decompressobj(-15)
+    elif codec == Z_DEFLATE_DICT:
+        decompressor = zlib.decompressobj(-15, zdict=ZDICT)
+    else:
+        raise ValueError("unknown codec %d" % codec)
+    payload = decompressor.decompress(data[1:])
+    if not decompressor.eof:
+        raise zlib.error("truncated stream")
+    return payload
@@ -1,7 +1,11 @@
 import os
+import struct
 from datetime import datetime
 import paho.mqtt.client as mqtt
 import pymongo
+from binary_format import decode_binary
+from compression import decompress, Z_TOPIC
+import zlib
 
 MQTT_TOPIC="aauiot/"
 # root is username, example is password and ip is the docker container's ip
@@ -176,14 +180,34 @@ def on_message(client, userdata, msg):
     now = datetime.now()
     received_timestamp = now.strftime("%d/%H:%M:%S")
     #print(received_timestamp)
-    payload = msg.payload.decode('UTF-8').split(",")
+    msg_topic = msg.topic
+    msg_payload = msg.payload
+    if msg_topic.startswith(MQTT_TOPIC+Z_TOPIC):
+        try:
+            msg_payload = decompress(msg_payload)
+        except (ValueError, zlib.error) as err:
+            print("invalid compressed payload:", err)
+            return -1
+        msg_topic = MQTT_TOPIC + msg_topic[len(MQTT_TOPIC+Z_TOPIC):]
+    if msg_topic.startswith(MQTT_TOPIC+"bin/"):
+        try:
+            userid, topic, payloads, sample_timestamps = decode_binary(msg_payload)
+        except (ValueError, IndexError, struct.error) as err:
+            print("invalid binary payload:", err)
+            return -1
+        if len(sample_timestamps) == 1:
+            sample_timestamps = sample_timestamps * len(payloads)
+        received_timestamps = [received_timestamp]*len(payloads)
+        database_add(topic, payloads, sample_timestamps, received_timestamps, userid)
+        return
+    payload = msg_payload.decode('UTF-8').split(",")
     userid = payload[0]
     payload.pop(0)
 
-    if str(msg.topic)==MQTT_TOPIC+'download':
+    if str(msg_topic)==MQTT_TOPIC+'download':
         sensor_type=payload[0]
         database_export(userid,sensor_type)
-    elif msg.topic == MQTT_TOPIC+"multiple":
+    elif msg_topic == MQTT_TOPIC+"multiple":
         topics, payloads, sample_timestamps= find_generic_topics(payload)
         if len(payloads)==0:
             err="was any sensor data sent?"